@@ -1,40 +1,158 @@
 #!/usr/bin/env python3
+import codecs
 import os
+import re
 import sys
+import json
+import mmap
 import argparse
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 
+BINARY_SNIFF_SIZE = 2048
 
-def is_probably_binary(path, sample_size=2048):
+
+def load_mapping(path):
+    """Read OLD -> NEW pairs from a JSON object or a tab-separated file.
+
+    In the tab-separated form each non-empty line is ``OLD<TAB>NEW``; lines
+    starting with ``#`` are comments.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    if path.lower().endswith(".json"):
+        mapping = json.loads(raw)
+        if not isinstance(mapping, dict):
+            raise ValueError("mapping JSON must be an object of OLD: NEW pairs")
+        return {str(k): str(v) for k, v in mapping.items()}
+    mapping = {}
+    for lineno, line in enumerate(raw.splitlines(), 1):
+        if not line.strip() or line.startswith("#"):
+            continue
+        old, sep, new = line.partition("\t")
+        if not sep:
+            raise ValueError(f"{path}:{lineno}: expected OLD<TAB>NEW")
+        mapping[old] = new
+    return mapping
+
+
+def _trie_regex(words):
+    """Return a regex source matching any of `words`, leftmost-longest.
+
+    The alternation is factored into a trie, so the regex engine walks the
+    input once and shares work between patterns with common prefixes, the
+    way an Aho-Corasick automaton would.
+    """
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[None] = True
+
+    def emit(node):
+        alts = []
+        for ch in sorted(k for k in node if k is not None):
+            literal = ch
+            child = node[ch]
+            # Collapse single-child chains into one literal run.
+            while None not in child and len(child) == 1:
+                (nxt,) = child
+                literal += nxt
+                child = child[nxt]
+            alts.append(re.escape(literal) + emit(child))
+        if not alts:
+            return ""
+        group = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if None in node:
+            # A shorter word ends here; the greedy ? still prefers longer ones.
+            return "(?:" + group + ")?"
+        return group
+
+    return emit(trie)
+
+
+class Replacer:
+    """Apply every OLD -> NEW pair of a mapping in a single pass over text."""
+
+    def __init__(self, mapping, case_insensitive=False, encodings=("utf-8",)):
+        if not mapping or any(not k for k in mapping):
+            raise ValueError("mapping must contain non-empty strings to replace")
+        flags = re.IGNORECASE if case_insensitive else 0
+        self.case_insensitive = case_insensitive
+        if case_insensitive:
+            self.lookup = {k.lower(): v for k, v in mapping.items()}
+        else:
+            self.lookup = dict(mapping)
+        self.pattern = re.compile(_trie_regex(self.lookup), flags)
+        self.screen = self._byte_screen(mapping, encodings, flags)
+
+    @staticmethod
+    def _byte_screen(mapping, encodings, flags):
+        # bytes regexes only fold ASCII case, so non-ASCII patterns cannot be
+        # pre-screened case-insensitively.
+        if flags and not all(k.isascii() for k in mapping):
+            return None
+        variants = set()
+        for enc in encodings:
+            try:
+                codec = codecs.lookup(enc)
+            except LookupError:
+                continue
+            if codec.name.startswith(("utf-16", "utf-32")):
+                continue  # their files contain NULs and are skipped as binary
+            # Codecs like utf-8-sig put a BOM before every encoded string;
+            # the pattern itself is what follows it.
+            bom = codec.encode("")[0]
+            for k in mapping:
+                try:
+                    encoded = codec.encode(k)[0]
+                except UnicodeEncodeError:
+                    continue
+                variants.add(encoded[len(bom):].decode("latin-1"))
+        if not variants:
+            return None
+        return re.compile(_trie_regex(variants).encode("latin-1"), flags)
+
+    def _sub(self, m):
+        key = m.group(0).lower() if self.case_insensitive else m.group(0)
+        return self.lookup[key]
+
+    def replace(self, text):
+        return self.pattern.subn(self._sub, text)
+
+
+def replace_in_file(path, replacer, encoding_list, dry_run, make_backup):
     try:
         with open(path, "rb") as f:
-            chunk = f.read(sample_size)
-        if b"\x00" in chunk:
-            return True
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return 0, "no-change"  # empty file
+            with mm:
+                if b"\x00" in mm[:BINARY_SNIFF_SIZE]:
+                    return 0, "binary-skip"
+                # Cheap byte-level check so files without any match are never decoded.
+                if replacer.screen is not None and not replacer.screen.search(mm):
+                    return 0, "screened-out"
+                raw = mm[:]
     except Exception:
-        return True
-    return False
-
-
-def replace_in_file(path, old, new, encoding_list, dry_run, make_backup):
-    if is_probably_binary(path):
         return 0, "binary-skip"
     original = None
     for enc in encoding_list:
         try:
-            with open(path, "r", encoding=enc, errors="strict") as f:
-                original = f.read()
+            original = raw.decode(enc)
             encoding_used = enc
             break
         except Exception:
             continue
     if original is None:
         return 0, "decode-fail"
-    if old not in original:
+    updated, count = replacer.replace(original)
+    if count == 0:
         return 0, "no-change"
-    updated = original.replace(old, new)
     if dry_run:
-        return original.count(old), "would-change"
+        return count, "would-change"
     if make_backup:
         backup_path = path + ".bak"
         if not os.path.exists(backup_path):
@@ -43,11 +161,37 @@ def replace_in_file(path, old, new, encoding_list, dry_run, make_backup):
             except Exception:
                 pass
     try:
-        with open(path, "w", encoding=encoding_used, errors="strict") as f:
-            f.write(updated)
+        with open(path, "wb") as f:
+            f.write(updated.encode(encoding_used, errors="strict"))
     except Exception:
         return 0, "write-fail"
-    return original.count(old), "changed"
+    return count, "changed"
+
+
+_worker = {}
+
+
+def _init_worker(mapping, case_insensitive, encodings, dry_run, make_backup):
+    _worker["replacer"] = Replacer(mapping, case_insensitive, encodings)
+    _worker["args"] = (encodings, dry_run, make_backup)
+
+
+def _process_file(path):
+    occ, status = replace_in_file(path, _worker["replacer"], *_worker["args"])
+    return path, occ, status
+
+
+def process_contents(paths, mapping, case_insensitive, encodings, dry_run, make_backup, jobs):
+    """Run content replacement over `paths`; results come back in input order."""
+    init_args = (mapping, case_insensitive, encodings, dry_run, make_backup)
+    if jobs <= 1 or len(paths) < 2:
+        _init_worker(*init_args)
+        return [_process_file(p) for p in paths]
+    chunksize = max(1, len(paths) // (jobs * 8))
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=init_args
+    ) as pool:
+        return list(pool.map(_process_file, paths, chunksize=chunksize))
 
 
 def safe_rename(old_path, new_path, dry_run):
@@ -66,10 +210,16 @@ def safe_rename(old_path, new_path, dry_run):
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Recursively replace a string in file contents, file names, and folder names."
+        description="Recursively replace strings in file contents, file names, and folder names."
+    )
+    parser.add_argument("old", nargs="?", help="String to replace.")
+    parser.add_argument("new", nargs="?", help="Replacement string.")
+    parser.add_argument(
+        "-m",
+        "--mapping",
+        help="File with many OLD -> NEW pairs (JSON object, or OLD<TAB>NEW lines); "
+        "all of them are applied in a single pass.",
     )
-    parser.add_argument("old", help="String to replace.")
-    parser.add_argument("new", help="Replacement string.")
     parser.add_argument(
         "-r",
         "--root",
@@ -112,22 +262,36 @@ def main():
     parser.add_argument(
         "--follow-links", action="store_true", help="Follow directory symlinks."
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes for file contents (default: CPU count).",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="List every changed file and rename in the summary.",
+    )
     args = parser.parse_args()
 
-    old = args.old
-    new = args.new
-    dry_run = not args.apply
-
-    if args.case_insensitive:
-        # For file contents: we'll do a simple case-insensitive replace by scanning.
-        def ci_replace(text, old_ci, repl):
-            import re
-
-            pattern = re.compile(re.escape(old_ci), re.IGNORECASE)
-            return pattern.sub(repl, text), len(pattern.findall(text))
+    mapping = {}
+    if args.mapping:
+        mapping.update(load_mapping(args.mapping))
+    if args.old is not None:
+        if args.new is None:
+            parser.error("NEW is required when OLD is given")
+        mapping[args.old] = args.new
+    if not mapping:
+        parser.error("give OLD NEW or --mapping FILE")
+    try:
+        replacer = Replacer(mapping, args.case_insensitive, args.encoding)
+    except ValueError as e:
+        parser.error(str(e))
 
-    else:
-        ci_replace = None
+    dry_run = not args.apply
 
     include_ext = set(e.lower() for e in args.include_ext) if args.include_ext else None
     exclude_ext = (
@@ -137,132 +301,97 @@ def main():
     stats = {
         "files_content_changed": 0,
         "files_content_skipped": 0,
+        "files_screened_out": 0,
         "occurrences_replaced": 0,
         "file_renames": 0,
         "dir_renames": 0,
         "errors": 0,
     }
+    changed_files = []
+    renames = []
 
-    # Collect rename operations separately? We'll do in-place bottom-up for directories to avoid path breakage.
+    # Walk once bottom-up; contents are processed in parallel first, then
+    # names are renamed in walk order so children go before their folders.
+    walk = []
+    content_paths = []
     for root, dirs, files in os.walk(
         args.root, topdown=False, followlinks=args.follow_links
     ):
         # Never touch anything inside a .git directory (skip processing entirely)
         if ".git" in root.split(os.sep):
             continue
-        # File contents & file renames
+        walk.append((root, sorted(files)))
+        if args.no_contents:
+            continue
         for fname in files:
-            fpath = os.path.join(root, fname)
             ext = os.path.splitext(fname)[1].lower()
-            if not args.no_contents:
-                if include_ext and ext not in include_ext:
-                    stats["files_content_skipped"] += 1
-                elif ext in exclude_ext:
-                    stats["files_content_skipped"] += 1
-                else:
-                    if args.case_insensitive:
-                        if is_probably_binary(fpath):
-                            stats["files_content_skipped"] += 1
-                        else:
-                            # Manual CI content replace
-                            try:
-                                with open(fpath, "rb") as fb:
-                                    raw = fb.read()
-                                # try encodings
-                                text = None
-                                used_enc = None
-                                for enc in args.encoding:
-                                    try:
-                                        text = raw.decode(enc)
-                                        used_enc = enc
-                                        break
-                                    except Exception:
-                                        continue
-                                if text is None:
-                                    stats["files_content_skipped"] += 1
-                                else:
-                                    new_text, count = ci_replace(text, old, new)
-                                    if count > 0:
-                                        if dry_run:
-                                            stats["files_content_changed"] += 1
-                                            stats["occurrences_replaced"] += count
-                                        else:
-                                            if args.backup and not os.path.exists(
-                                                fpath + ".bak"
-                                            ):
-                                                try:
-                                                    shutil.copy2(fpath, fpath + ".bak")
-                                                except Exception:
-                                                    pass
-                                            with open(
-                                                fpath, "w", encoding=used_enc
-                                            ) as fw:
-                                                fw.write(new_text)
-                                            stats["files_content_changed"] += 1
-                                            stats["occurrences_replaced"] += count
-                                    else:
-                                        stats["files_content_skipped"] += 1
-                            except Exception:
-                                stats["errors"] += 1
-                    else:
-                        occ, status = replace_in_file(
-                            fpath, old, new, args.encoding, dry_run, args.backup
-                        )
-                        if status in ("changed", "would-change"):
-                            stats["files_content_changed"] += 1
-                            stats["occurrences_replaced"] += occ
-                        else:
-                            stats["files_content_skipped"] += 1
-
-            if not args.no_names:
-                target_name_source = fname
-                if args.case_insensitive:
-                    import re
-
-                    pattern = re.compile(re.escape(old), re.IGNORECASE)
-                    if pattern.search(target_name_source):
-                        new_name = pattern.sub(new, target_name_source)
-                    else:
-                        new_name = target_name_source
-                else:
-                    new_name = target_name_source.replace(old, new)
-                if new_name != target_name_source:
-                    old_full = fpath
-                    new_full = os.path.join(root, new_name)
-                    ok, reason = safe_rename(old_full, new_full, dry_run)
+            if (include_ext and ext not in include_ext) or ext in exclude_ext:
+                stats["files_content_skipped"] += 1
+            else:
+                content_paths.append(os.path.join(root, fname))
+
+    content_paths.sort()
+    results = process_contents(
+        content_paths,
+        mapping,
+        args.case_insensitive,
+        args.encoding,
+        dry_run,
+        args.backup,
+        max(1, args.jobs),
+    )
+    for fpath, occ, status in results:
+        if status in ("changed", "would-change"):
+            stats["files_content_changed"] += 1
+            stats["occurrences_replaced"] += occ
+            changed_files.append(fpath)
+        else:
+            stats["files_content_skipped"] += 1
+            if status == "screened-out":
+                stats["files_screened_out"] += 1
+            elif status == "write-fail":
+                stats["errors"] += 1
+
+    if not args.no_names:
+        for root, files in walk:
+            for fname in files:
+                new_name, _ = replacer.replace(fname)
+                if new_name != fname:
+                    ok, reason = safe_rename(
+                        os.path.join(root, fname), os.path.join(root, new_name), dry_run
+                    )
                     if ok:
                         stats["file_renames"] += 1
+                        renames.append((os.path.join(root, fname), new_name))
                     elif reason.startswith("error"):
                         stats["errors"] += 1
 
-        # Directory renames
-        if not args.no_names:
+            # Directory renames
             dname = os.path.basename(root)
             parent = os.path.dirname(root)
-            if args.case_insensitive:
-                import re
-
-                pattern = re.compile(re.escape(old), re.IGNORECASE)
-                if pattern.search(dname):
-                    new_dname = pattern.sub(new, dname)
-                else:
-                    new_dname = dname
-            else:
-                new_dname = dname.replace(old, new)
+            new_dname, _ = replacer.replace(dname)
             if new_dname != dname and parent:
-                old_dir = root
-                new_dir = os.path.join(parent, new_dname)
-                ok, reason = safe_rename(old_dir, new_dir, dry_run)
+                ok, reason = safe_rename(root, os.path.join(parent, new_dname), dry_run)
                 if ok:
                     stats["dir_renames"] += 1
+                    renames.append((root, new_dname))
                 elif reason.startswith("error"):
                     stats["errors"] += 1
 
     mode = "DRY-RUN" if dry_run else "APPLIED"
     print(f"=== {mode} SUMMARY ===")
+    print(f"patterns: {len(mapping)}")
     for k, v in stats.items():
         print(f"{k}: {v}")
 
+    if args.verbose:
+        print("=== CONTENT CHANGES ===")
+        for fpath in changed_files:
+            print(fpath)
+        print("=== RENAMES ===")
+        for old_path, new_name in renames:
+            print(f"{old_path} -> {new_name}")
+
     if dry_run:
         print("Re-run with --apply to perform the changes.")
 
@@ -271,5 +400,6 @@ if __name__ == "__main__":
     if len(sys.argv) == 1:
         print("Use -h for help. Example:")
         print("  python rename.py OLD_STRING NEW_STRING --root . --apply")
+        print("  python rename.py --mapping renames.tsv --root . --apply")
         sys.exit(1)
     main()
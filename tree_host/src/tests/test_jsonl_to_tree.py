@@ -0,0 +1,13 @@
+from tree_host.domain import jsonl_to_tree
+
+
+def test_prefix_kept_when_parent_path_is_spelled_differently():
+    nodes = jsonl_to_tree.normalize_nodes([
+        {"id": "home", "title": "Home", "path": ["Home"]},
+        {"id": "home:settings", "title": "Settings", "parent": "home", "path": ["home", "Settings"]},
+        {"id": "home:about", "title": "About", "parent": "home", "path": ["Home", "About"]},
+    ])
+    paths = {i: jsonl_to_tree.node_path(nodes, n) for i, n in nodes.items()}
+    assert paths["home:settings"] == ["home", "Settings"]
+    assert paths["home:about"] == ["Home", "About"]
+    assert nodes["home:about"].prefix is None
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from tree_host.domain import action_index, tree_builder
+
+
+def _store(tmp_path, monkeypatch, records):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(action_index, "index", action_index.ActionIndex())
+    (tmp_path / "data").mkdir()
+    with open(tmp_path / "data" / "actions.jsonl", "w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+def _stored(tmp_path):
+    with open(tmp_path / "data" / "actions.jsonl", encoding="utf-8") as f:
+        return {rec["id"]: rec for rec in map(json.loads, f)}
+
+
+def test_move_rewrites_parents_that_were_never_captured(tmp_path, monkeypatch):
+    _store(tmp_path, monkeypatch, [
+        {"id": "b:c", "title": "c", "parent": "b", "path": ["b", "c"]},
+        {"id": "b:c:a:b", "title": "b", "parent": "b:c:a", "path": ["b", "c", "a", "b"]},
+    ])
+    assert tree_builder.move_tree_node("b:c", None) == ("c", 2)
+    stored = _stored(tmp_path)
+    assert stored["c:a:b"]["parent"] == "c:a"
+    assert stored["c:a:b"]["path"] == ["c", "a", "b"]
+
+
+def test_move_refuses_to_overwrite_below_an_uncaptured_root(tmp_path, monkeypatch):
+    _store(tmp_path, monkeypatch, [
+        {"id": "settings:save", "title": "save", "parent": "settings", "route": "/s"},
+        {"id": "prefs", "title": "prefs", "parent": None, "path": ["prefs"]},
+        {"id": "prefs:save", "title": "save", "parent": "prefs", "path": ["prefs", "save"]},
+    ])
+    with pytest.raises(tree_builder.MoveConflictError):
+        tree_builder.move_tree_node("prefs", new_title="Settings")
+
+
+def test_move_rejects_titles_without_an_id(tmp_path, monkeypatch):
+    _store(tmp_path, monkeypatch, [
+        {"id": "settings", "title": "settings", "parent": None, "path": ["settings"]},
+    ])
+    with pytest.raises(ValueError):
+        tree_builder.move_tree_node("settings", new_title="???")
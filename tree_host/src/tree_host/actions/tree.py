@@ -1,19 +1,100 @@
-import os
-import json
-from tree_host.domain import tree_builder
+import itertools
 
+from starlette.concurrency import run_in_threadpool
 
-async def load_index():
-    return tree_builder.build_tree_html()
+from tree_host.domain import action_store, tree_builder, tree_export
+from tree_host.profiling import profiled
+from tree_host.response.cache import CachedPage, ResponseCache
+
+page_cache = ResponseCache()
+
+
+async def _snapshot() -> action_store.Snapshot:
+    # Only the first load reads the shards; do it off the event loop.
+    snap = action_store.store.snapshot(wait=False)
+    if snap is None:
+        snap = await run_in_threadpool(profiled(action_store.store.snapshot))
+    return snap
+
+
+async def load_index() -> CachedPage:
+    snap = await _snapshot()
+
+    async def render() -> str:
+        return await run_in_threadpool(profiled(tree_builder.build_tree_html), snap)
+
+    return await page_cache.get(snap.generation, render)
+
+
+def _mutated() -> None:
+    page_cache.invalidate()
+
+
+async def _commit(apply):
+    # Writers serialise on the store lock in a worker thread, so the event
+    # loop keeps serving snapshot reads meanwhile.
+    return await run_in_threadpool(profiled(action_store.store.commit), apply)
 
 
 async def update_tree(action: dict):
-    file_path = "./data/actions.jsonl"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(action) + "\n")
+    await _commit(lambda nodes: tree_builder.append_action(action, nodes))
+    _mutated()
 
 
 async def delete_node(payload: dict):
     target_id = payload.get("id")
-    tree_builder.delete_tree_node(target_id)
+    if await _commit(lambda nodes: tree_builder.delete_tree_node(target_id, nodes)):
+        _mutated()
+
+
+async def move_node(payload: dict) -> dict:
+    new_root, moved = await _commit(
+        lambda nodes: tree_builder.move_tree_node(
+            payload["id"],
+            payload.get("parent", tree_builder.KEEP_PARENT),
+            payload.get("title"),
+            nodes,
+        )
+    )
+    if moved:
+        _mutated()
+    return {"id": new_root, "moved": moved}
+
+
+async def subtree_elements(root: str) -> dict:
+    snap = await _snapshot()
+    return await run_in_threadpool(profiled(tree_builder.subtree_elements), snap, root)
+
+
+async def tree_stats() -> dict:
+    await _snapshot()  # schedules a reload if the shards changed
+    return action_store.store.stats.summary()
+
+
+async def orphan_actions(limit: int | None = None) -> list[dict]:
+    await _snapshot()
+    return await run_in_threadpool(profiled(action_store.store.stats.orphans), limit)
+
+
+async def _batched(chunks, size: int = 1024):
+    # Pull chunks in a worker, as StreamingResponse does for plain
+    # iterators, but through profiled() and a batch per hop.
+    step = profiled(lambda: "".join(itertools.islice(chunks, size)))
+    while batch := await run_in_threadpool(step):
+        yield batch
+
+
+async def export_tree(fmt: str, root: str | None = None, depth: int | None = None):
+    """Return the export as an async iterator of text.
+
+    Unknown formats and roots raise before anything is produced.
+    """
+    snap = await _snapshot()
+    chunks = await run_in_threadpool(
+        profiled(tree_export.export_tree),
+        fmt,
+        root=root,
+        depth=depth,
+        source=snap.actions,
+    )
+    return _batched(chunks)
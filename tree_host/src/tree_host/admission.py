@@ -0,0 +1,200 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class Rejected(Exception):
+    """The request was not admitted; retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take one token; return 0 on success or the seconds until one is free."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def idle_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class AdmissionController:
+    """Admission control for ingest (write) requests.
+
+    Writes pass a per-client token bucket, then wait in a bounded queue for
+    one of `max_writers` slots. A full queue is rejected right away instead
+    of letting latency grow without bound. Viewer reads never queue, and
+    waiting writes are held back while reads are in flight, for at most
+    `read_priority` seconds so a steady stream of viewers cannot starve
+    ingest.
+    """
+
+    MAX_BUCKETS = 1024
+
+    def __init__(
+        self,
+        rate: float = 20.0,
+        burst: float = 40.0,
+        max_writers: int = 1,
+        max_queue: int = 64,
+        read_priority: float = 0.5,
+        client_header: str | None = None,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_writers = max(1, max_writers)
+        self.max_queue = max(0, max_queue)
+        self.read_priority = read_priority
+        self.client_header = client_header or None
+        self._buckets: dict[str, TokenBucket] = {}
+        self._cond = asyncio.Condition()
+        self._write_seconds = 0.0  # moving average of write service time
+        self.reads_active = 0
+        self.writes_active = 0
+        self.writes_waiting = 0
+        self.counters = {
+            "writes_admitted": 0,
+            "writes_rejected_rate": 0,
+            "writes_rejected_queue": 0,
+            "reads": 0,
+            "queue_depth_max": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            rate=_env_float("TREE_HOST_INGEST_RATE", 20.0),
+            burst=_env_float("TREE_HOST_INGEST_BURST", 40.0),
+            max_writers=int(_env_float("TREE_HOST_INGEST_WRITERS", 1)),
+            max_queue=int(_env_float("TREE_HOST_INGEST_QUEUE", 64)),
+            read_priority=_env_float("TREE_HOST_READ_PRIORITY", 0.5),
+            client_header=os.environ.get("TREE_HOST_CLIENT_HEADER"),
+        )
+
+    def client_key(self, host: str | None, headers) -> str:
+        """Key a request's token bucket on `client_header`, else on the peer.
+
+        Behind NAT or a proxy (docker-compose's bridge network included)
+        every peer address is the same, so the header is how clients are
+        told apart. For X-Forwarded-For style lists the first entry counts.
+        """
+        if self.client_header:
+            value = headers.get(self.client_header)
+            if value:
+                return value.split(",")[0].strip()
+        return host or "unknown"
+
+    def _check_rate(self, client: str, now: float) -> None:
+        if self.rate <= 0:
+            return
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_BUCKETS:
+                # A refilled bucket is the same as a fresh one; drop those.
+                self._buckets = {
+                    k: b for k, b in self._buckets.items() if not b.idle_full(now)
+                }
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+        wait = bucket.take(now)
+        if wait:
+            self.counters["writes_rejected_rate"] += 1
+            raise Rejected("rate limit exceeded", wait)
+
+    def _may_write(self, since: float) -> bool:
+        if self.writes_active >= self.max_writers:
+            return False
+        return (
+            self.reads_active == 0
+            or time.monotonic() - since >= self.read_priority
+        )
+
+    @asynccontextmanager
+    async def write(self, client: str):
+        now = time.monotonic()
+        self._check_rate(client, now)
+        if self.writes_waiting + self.writes_active >= self.max_queue + self.max_writers:
+            self.counters["writes_rejected_queue"] += 1
+            raise Rejected(
+                "ingest queue full",
+                self._write_seconds * (self.writes_waiting + 1) / self.max_writers,
+            )
+        self.writes_waiting += 1
+        self.counters["queue_depth_max"] = max(
+            self.counters["queue_depth_max"], self.writes_waiting
+        )
+        try:
+            async with self._cond:
+                while not self._may_write(now):
+                    remaining = self.read_priority - (time.monotonic() - now)
+                    try:
+                        await asyncio.wait_for(
+                            self._cond.wait(), timeout=max(remaining, 0.01)
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                self.writes_active += 1
+        finally:
+            self.writes_waiting -= 1
+        self.counters["writes_admitted"] += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._write_seconds = 0.8 * self._write_seconds + 0.2 * elapsed
+            async with self._cond:
+                self.writes_active -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def read(self):
+        self.reads_active += 1
+        self.counters["reads"] += 1
+        try:
+            yield
+        finally:
+            self.reads_active -= 1
+            if self.reads_active == 0 and self.writes_waiting:
+                async with self._cond:
+                    self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        return {
+            "config": {
+                "rate": self.rate,
+                "burst": self.burst,
+                "max_writers": self.max_writers,
+                "max_queue": self.max_queue,
+                "read_priority": self.read_priority,
+                "client_header": self.client_header,
+            },
+            "queue_depth": self.writes_waiting,
+            "writes_active": self.writes_active,
+            "reads_active": self.reads_active,
+            "write_seconds_avg": round(self._write_seconds, 6),
+            "clients_tracked": len(self._buckets),
+            **self.counters,
+        }
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+
+from tree_host.domain import action_store, static_site
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build the tree view from captured JSONL files into a static, server-less bundle."
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        default=action_store.DATA_DIR,
+        help="Directory holding the *.jsonl captures (default: ./data).",
+    )
+    parser.add_argument(
+        "-o", "--out", default="./site", help="Output bundle directory (default: ./site)."
+    )
+    parser.add_argument(
+        "--cytoscape",
+        help="Local cytoscape.min.js to ship in the bundle (needed on the first build).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Where to keep parsed shards between builds (default: <out>-cache, "
+        "outside the bundle).",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        report = static_site.build_static_site(
+            args.data_dir,
+            args.out,
+            cytoscape_js=args.cytoscape,
+            cache_dir=args.cache_dir,
+        )
+    except FileNotFoundError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    print(f"shards: {report.shards_total}")
+    print(f"shards_reused: {report.shards_reused}")
+    print(f"shards_processed: {len(report.shards_processed)}")
+    for rel in report.shards_processed:
+        print(f"  {rel}")
+    print(f"page: {'written' if report.page_written else 'up to date'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
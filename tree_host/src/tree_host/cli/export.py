@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+
+from tree_host.domain import action_store, tree_export
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Export the captured action tree as DOT, GraphML, Mermaid or nested"
+            " JSON. Re-captured ids resolve like on the server (last record"
+            " wins), so the whole tree is held in memory while exporting."
+        )
+    )
+    parser.add_argument("format", choices=tree_export.FORMATS, help="Output format.")
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        default=action_store.DATA_DIR,
+        help="Directory holding the *.jsonl captures (default: ./data).",
+    )
+    parser.add_argument("--root", help="Only export the subtree rooted at this node id.")
+    parser.add_argument(
+        "--depth",
+        type=int,
+        help="Only export nodes at most this many levels below the root.",
+    )
+    parser.add_argument(
+        "-o", "--output", help="Write to this file instead of stdout."
+    )
+    args = parser.parse_args(argv)
+
+    files = action_store.data_glob(args.data_dir)
+    try:
+        chunks = tree_export.export_tree(
+            args.format,
+            root=args.root,
+            depth=args.depth,
+            source=lambda: tree_export.stored_actions(files),
+        )
+    except KeyError:
+        print(f"No node with id {args.root!r} in {args.data_dir}", file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            out.writelines(chunks)
+    else:
+        sys.stdout.writelines(chunks)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from websockets.asyncio.client import connect as ws_connect
+
+from tree_host.domain import action_store
+
+ACTION_FIELDS = ("id", "parent", "path", "title", "route", "type")
+
+
+def replay_schedule(actions: list[dict], speed: float, interval: float) -> list[float]:
+    """Return the send offset (seconds from start) for every action.
+
+    Uses the `ts` the server records on ingest; captures without it are
+    spaced `interval` seconds apart. Both are divided by `speed`.
+    """
+    offsets = []
+    offset = 0.0
+    prev_ts = None
+    for i, a in enumerate(actions):
+        ts = a.get("ts")
+        if i:
+            if isinstance(ts, (int, float)) and prev_ts is not None and ts >= prev_ts:
+                offset += (ts - prev_ts) / speed
+            else:
+                offset += interval / speed
+        prev_ts = ts if isinstance(ts, (int, float)) else None
+        offsets.append(offset)
+    return offsets
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def read_rss(pid: int | None) -> int | None:
+    """Resident set size in bytes of `pid` (or this process)."""
+    path = f"/proc/{pid or 'self'}/status"
+    try:
+        with open(path, "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None:
+        # Peak rather than current RSS, but better than nothing off Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+class HttpConnection:
+    """Minimal keep-alive HTTP/1.1 client; enough to drive the tree host."""
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method: str, path: str, body: bytes | None = None):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        if body is not None:
+            head += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        self._writer.write(("\r\n".join(head) + "\r\n\r\n").encode("ascii") + (body or b""))
+        try:
+            return await self._read_response()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            raise
+
+    async def _read_response(self):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            payload = b"".join(chunks)
+        else:
+            payload = await self._reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, payload
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+@dataclass
+class Results:
+    posts: list[tuple[float, float, int]] = field(default_factory=list)  # sent, done, status
+    notifications: list[list[float]] = field(default_factory=list)  # per viewer
+    page_fetches: list[float] = field(default_factory=list)
+    rss: list[tuple[float, int]] = field(default_factory=list)
+    errors: int = 0
+
+
+async def run_client(conn, actions, offsets, start, results):
+    for action, offset in zip(actions, offsets):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        body = json.dumps({k: action.get(k) for k in ACTION_FIELDS}).encode("utf-8")
+        sent = time.perf_counter()
+        try:
+            status, _ = await conn.request("POST", "/update-tree", body)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            results.errors += 1
+            continue
+        results.posts.append((sent, time.perf_counter(), status))
+    await conn.close()
+
+
+async def run_viewer(base_ws, conn, received, results, ready):
+    reload_needed = asyncio.Event()
+
+    async def refetch():
+        while True:
+            await reload_needed.wait()
+            reload_needed.clear()
+            t0 = time.perf_counter()
+            try:
+                await conn.request("GET", "/")
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                results.errors += 1
+                continue
+            results.page_fetches.append(time.perf_counter() - t0)
+
+    fetcher = asyncio.create_task(refetch())
+    try:
+        async with ws_connect(base_ws + "/ws", max_size=None) as ws:
+            ready.release()
+            async for _ in ws:
+                received.append(time.perf_counter())
+                reload_needed.set()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        fetcher.cancel()
+        await conn.close()
+
+
+async def sample_rss(pid, results, interval, start):
+    while True:
+        rss = read_rss(pid)
+        if rss is not None:
+            results.rss.append((time.perf_counter() - start, rss))
+        await asyncio.sleep(interval)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start_in_process_server():
+    import uvicorn
+
+    from tree_host import fastapi_app
+    from tree_host.admission import AdmissionController
+
+    # Every simulated client connects from 127.0.0.1 and would share one
+    # token bucket, so the replay would only measure the rate limit.
+    admission = AdmissionController.from_env()
+    admission.rate = 0
+    fastapi_app.admission = admission
+    app = fastapi_app.app
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def run(args, actions) -> dict:
+    server = server_task = None
+    rss_pid = args.server_pid
+    if args.url:
+        base = args.url.rstrip("/")
+    else:
+        server, server_task, base = await start_in_process_server()
+    parts = urlsplit(base)
+    host, port = parts.hostname, parts.port or 80
+    base_ws = f"ws://{host}:{port}"
+
+    results = Results()
+    viewers_ready = asyncio.Semaphore(0)
+    viewer_tasks = []
+    for _ in range(args.viewers):
+        received: list[float] = []
+        results.notifications.append(received)
+        viewer_tasks.append(
+            asyncio.create_task(
+                run_viewer(base_ws, HttpConnection(host, port), received, results, viewers_ready)
+            )
+        )
+    for _ in range(args.viewers):
+        await asyncio.wait_for(viewers_ready.acquire(), timeout=10)
+
+    offsets = replay_schedule(actions, args.speed, args.interval)
+    start = time.perf_counter()
+    sampler = None
+    if rss_pid is not None or not args.url:
+        # Without --server-pid only the in-process server is this process.
+        sampler = asyncio.create_task(
+            sample_rss(rss_pid, results, args.rss_interval, start)
+        )
+    client_tasks = []
+    for c in range(args.clients):
+        mine = range(c, len(actions), args.clients)
+        client_tasks.append(
+            asyncio.create_task(
+                run_client(
+                    HttpConnection(host, port),
+                    [actions[i] for i in mine],
+                    [offsets[i] for i in mine],
+                    start,
+                    results,
+                )
+            )
+        )
+    await asyncio.gather(*client_tasks)
+    ingest_done = time.perf_counter()
+    await asyncio.sleep(args.drain)
+
+    background = viewer_tasks + ([sampler] if sampler else [])
+    for t in background:
+        t.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    if server is not None:
+        server.should_exit = True
+        await server_task
+    return summarize(results, ingest_done - start)
+
+
+def summarize(results: Results, elapsed: float) -> dict:
+    ok = [(sent, done) for sent, done, status in results.posts if status == 200]
+    rejected = sum(1 for _, _, status in results.posts if status == 429)
+    post_latency = [done - sent for sent, done in ok]
+    notify = []
+    # Every accepted write broadcasts once, but notifications carry no id.
+    # The server commits, broadcasts and only then responds, so posts are
+    # matched to notifications in completion order, which follows commit
+    # order across clients; send order does not once --clients > 1. This
+    # is an approximation: responses that overtake each other on the way
+    # back swap their latencies.
+    by_completion = sorted(ok, key=lambda p: p[1])
+    for received in results.notifications:
+        j = 0
+        for sent, _ in by_completion:
+            while j < len(received) and received[j] < sent:
+                j += 1
+            if j == len(received):
+                break
+            notify.append(received[j] - sent)
+            j += 1
+
+    def dist(values):
+        return {
+            "count": len(values),
+            **{f"p{p}": percentile(values, p) for p in (50, 90, 99)},
+            "max": max(values) if values else None,
+        }
+
+    rss = [b for _, b in results.rss]
+    return {
+        "elapsed_s": elapsed,
+        "posts_ok": len(ok),
+        "posts_rejected": rejected,
+        "posts_other": len(results.posts) - len(ok) - rejected,
+        "errors": results.errors,
+        "ingest_per_s": len(ok) / elapsed if elapsed > 0 else None,
+        "post_latency_s": dist(post_latency),
+        "notify_latency_s": dist(notify),
+        "page_fetch_s": dist(results.page_fetches),
+        "rss_bytes": {
+            "start": rss[0] if rss else None,
+            "max": max(rss) if rss else None,
+            "end": rss[-1] if rss else None,
+            "series": results.rss,
+        },
+    }
+
+
+def _fmt(v) -> str:
+    if v is None:
+        return "-"
+    if isinstance(v, float):
+        return f"{v * 1000:.1f}ms"
+    return str(v)
+
+
+def print_report(report: dict) -> None:
+    print("=== LOAD SUMMARY ===")
+    print(f"elapsed_s: {report['elapsed_s']:.2f}")
+    for key in ("posts_ok", "posts_rejected", "posts_other", "errors"):
+        print(f"{key}: {report[key]}")
+    rate = report["ingest_per_s"]
+    print(f"ingest_per_s: {rate:.1f}" if rate is not None else "ingest_per_s: -")
+    for key in ("post_latency_s", "notify_latency_s", "page_fetch_s"):
+        d = report[key]
+        cells = " ".join(f"{k}={_fmt(d[k])}" for k in ("p50", "p90", "p99", "max"))
+        print(f"{key[:-2]}: n={d['count']} {cells}")
+    rss = report["rss_bytes"]
+    if rss["max"] is not None:
+        mib = {k: rss[k] / (1 << 20) for k in ("start", "max", "end")}
+        print(f"rss_mib: start={mib['start']:.1f} max={mib['max']:.1f} end={mib['end']:.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay recorded captures against a tree host with simulated bookmarklets and viewers."
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        default=action_store.DATA_DIR,
+        help="Directory with the *.jsonl captures to replay (default: ./data).",
+    )
+    parser.add_argument(
+        "--url",
+        help="Base URL of a running localhost server; default starts one in-process "
+        "on a scratch data directory.",
+    )
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier.")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        help="Seconds between actions that carry no ts (before --speed).",
+    )
+    parser.add_argument("--clients", type=int, default=4, help="Simulated bookmarklets.")
+    parser.add_argument("--viewers", type=int, default=8, help="Simulated viewers on /ws.")
+    parser.add_argument("--limit", type=int, help="Replay at most this many actions.")
+    parser.add_argument(
+        "--drain", type=float, default=2.0, help="Seconds to wait for notifications at the end."
+    )
+    parser.add_argument(
+        "--server-pid",
+        type=int,
+        help="Sample RSS of this pid. Needed for RSS with --url; the in-process "
+        "server is sampled by default.",
+    )
+    parser.add_argument("--rss-interval", type=float, default=0.5, help="RSS sampling period.")
+    parser.add_argument("--json", help="Also write the full report as JSON to this file.")
+    args = parser.parse_args(argv)
+    if args.speed <= 0 or args.clients < 1 or args.viewers < 0:
+        parser.error("--speed must be > 0, --clients >= 1, --viewers >= 0")
+
+    actions = list(action_store.iter_actions(action_store.data_glob(args.data_dir)))
+    if args.limit is not None:
+        actions = actions[: args.limit]
+    if not actions:
+        print(f"No actions found in {args.data_dir}", file=sys.stderr)
+        return 1
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    if args.url:
+        report = asyncio.run(run(args, actions))
+    else:
+        # The in-process server writes to ./data; keep that away from the captures.
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory(prefix="tree-host-load-") as scratch:
+            os.chdir(scratch)
+            try:
+                report = asyncio.run(run(args, actions))
+            finally:
+                os.chdir(cwd)
+
+    print_report(report)
+    if args.url and args.server_pid is None:
+        print(
+            "warning: no RSS reported; pass --server-pid to sample the server at --url",
+            file=sys.stderr,
+        )
+    if args.url and report["posts_rejected"]:
+        print(
+            f"warning: {report['posts_rejected']} posts were rejected with 429; "
+            "the server's admission control limited the replay (run it with "
+            "TREE_HOST_INGEST_RATE=0 to measure ingest itself)",
+            file=sys.stderr,
+        )
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
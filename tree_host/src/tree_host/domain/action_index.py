@@ -0,0 +1,224 @@
+import bisect
+import json
+import os
+
+from tree_host.domain import action_store
+
+# A stored record: [shard path, byte offset of its line, byte length w/o newline]
+Location = list
+
+
+class _Shifts:
+    """Fenwick tree of offset shifts over a shard's record slots.
+
+    A rewrite that changes a record's length moves every later record; that
+    is one add_after() here instead of touching each of them, and shift()
+    reads the accumulated move of one slot. Both are O(log records).
+    """
+
+    def __init__(self, size: int = 0) -> None:
+        self._tree = [0] * (size + 1)
+
+    def _prefix(self, i: int) -> int:
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def append(self) -> None:
+        i = len(self._tree)
+        self._tree.append(self._prefix(i - 1) - self._prefix(i - (i & -i)))
+
+    def add_after(self, slot: int, delta: int) -> None:
+        i = slot + 2
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def shift(self, slot: int) -> int:
+        return self._prefix(slot + 1)
+
+
+class _Shard:
+    """Records of one shard in file order: id, start offset and length."""
+
+    def __init__(self) -> None:
+        self.ids: list[str] = []
+        self.starts: list[int] = []  # offset at scan or append time
+        self.lengths: list[int] = []
+        self.shifts = _Shifts()
+
+    def offset(self, slot: int) -> int:
+        return self.starts[slot] + self.shifts.shift(slot)
+
+    def slot_at(self, offset: int) -> int:
+        return bisect.bisect_left(range(len(self.ids)), offset, key=self.offset)
+
+    def append(self, node_id: str, offset: int, length: int) -> int:
+        self.shifts.append()
+        slot = len(self.ids)
+        self.ids.append(node_id)
+        self.starts.append(offset - self.shifts.shift(slot))
+        self.lengths.append(length)
+        return slot
+
+
+class ActionIndex:
+    """Sorted id index with the byte location of every stored record.
+
+    Ids are joined path segments, so a subtree is a contiguous id range and
+    can be found with two bisections. Locations let a writer read and
+    rewrite just the records of that range instead of parsing every shard.
+    Records are kept per shard by slot, so a rewrite only updates the
+    records it touched; the offsets of later records shift lazily. The
+    index is rebuilt lazily whenever the shards change behind its back.
+    """
+
+    def __init__(self, files: str = action_store.DATA_GLOB) -> None:
+        self._files = files
+        self._ids: list[str] = []
+        # id -> [(shard path, slot)] in storage order
+        self._locations: dict[str, list[tuple[str, int]]] = {}
+        self._shards: dict[str, _Shard] = {}
+        self._stamps: dict[str, tuple[int, int]] = {}
+        self._fresh = False
+
+    @staticmethod
+    def _stamp(path: str) -> tuple[int, int]:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def invalidate(self) -> None:
+        self._fresh = False
+
+    def ensure_fresh(self) -> None:
+        stamps = {}
+        for path in action_store.shard_paths(self._files):
+            try:
+                stamps[path] = self._stamp(path)
+            except FileNotFoundError:
+                continue
+        if self._fresh and stamps == self._stamps:
+            return
+        self._ids = []
+        self._locations = {}
+        self._shards = {}
+        self._stamps = stamps
+        for path in stamps:
+            self._scan_shard(path)
+        self._ids.sort()
+        self._fresh = True
+
+    def _scan_shard(self, path: str) -> None:
+        shard = self._shards[path] = _Shard()
+        offset = 0
+        with open(path, "rb") as f:
+            for raw in f:
+                line = raw.rstrip(b"\r\n")
+                if line.strip():
+                    try:
+                        obj = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        obj = None
+                    if isinstance(obj, dict) and isinstance(obj.get("id"), str):
+                        shard.ids.append(obj["id"])
+                        shard.starts.append(offset)
+                        shard.lengths.append(len(line))
+                        self._add(obj["id"], (path, len(shard.ids) - 1), keep_sorted=False)
+                offset += len(raw)
+        shard.shifts = _Shifts(len(shard.ids))
+
+    def _add(self, node_id: str, loc: tuple[str, int], keep_sorted: bool = True) -> None:
+        locs = self._locations.get(node_id)
+        if locs is None:
+            locs = self._locations[node_id] = []
+            if keep_sorted:
+                bisect.insort(self._ids, node_id)
+            else:
+                self._ids.append(node_id)
+        locs.append(loc)
+
+    def _discard(self, node_id: str) -> None:
+        self._locations.pop(node_id, None)
+        i = bisect.bisect_left(self._ids, node_id)
+        if i < len(self._ids) and self._ids[i] == node_id:
+            del self._ids[i]
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._locations
+
+    def descendants(self, root_id: str) -> list[str]:
+        """Return the stored ids below `root_id`, whether or not it is stored."""
+        lo = bisect.bisect_left(self._ids, f"{root_id}:")
+        # ";" is the character right after ":", so this bounds the prefix range.
+        hi = bisect.bisect_left(self._ids, f"{root_id};", lo)
+        return self._ids[lo:hi]
+
+    def subtree(self, root_id: str) -> list[str]:
+        """Return the root id followed by all stored descendants' ids."""
+        if root_id not in self._locations:
+            return []
+        return [root_id] + self.descendants(root_id)
+
+    def locations(self, node_id: str) -> list[Location]:
+        out = []
+        for path, slot in self._locations.get(node_id, ()):
+            shard = self._shards[path]
+            out.append([path, shard.offset(slot), shard.lengths[slot]])
+        return out
+
+    def read(self, node_id: str) -> dict | None:
+        """Return the last stored record for an id."""
+        locs = self.locations(node_id)
+        if not locs:
+            return None
+        path, offset, length = locs[-1]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def note_append(self, path: str, node_id: str, offset: int, length: int) -> None:
+        """Record a line appended by this process at `offset` of `path`."""
+        if not self._fresh:
+            return
+        if self._stamps.get(path, (0, 0))[1] != offset:
+            # Someone else touched the shard since we last looked.
+            self._fresh = False
+            return
+        shard = self._shards.setdefault(path, _Shard())
+        self._add(node_id, (path, shard.append(node_id, offset, length)))
+        self._stamps[path] = self._stamp(path)
+
+    def note_rewrite(
+        self, path: str, edits: list[tuple[int, int, int]], renamed: dict[str, str]
+    ) -> None:
+        """Record an in-place rewrite of `path`.
+
+        `edits` are (offset, old_length, new_length) of the rewritten records,
+        sorted by offset; `renamed` maps old ids to new ids for them. Other
+        records of the shard only shift by the accumulated size difference,
+        which is applied lazily.
+        """
+        shard = self._shards[path]
+        slots = [shard.slot_at(offset) for offset, _, _ in edits]
+        for slot, (_, old_len, new_len) in zip(slots, edits):
+            shard.lengths[slot] = new_len
+            if new_len != old_len:
+                shard.shifts.add_after(slot, new_len - old_len)
+        for slot in slots:
+            old_id = shard.ids[slot]
+            new_id = renamed.get(old_id, old_id)
+            if new_id == old_id:
+                continue
+            shard.ids[slot] = new_id
+            locs = [loc for loc in self._locations.get(old_id, []) if loc != (path, slot)]
+            if locs:
+                self._locations[old_id] = locs
+            else:
+                self._discard(old_id)
+            self._add(new_id, (path, slot))
+        self._stamps[path] = self._stamp(path)
+
+
+index = ActionIndex()
@@ -0,0 +1,197 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+from tree_host.domain import jsonl_to_tree, subtree_hash, tree_stats
+from tree_host.domain.chunked_map import ChunkedMap
+
+DATA_DIR = "./data"
+ACTIONS_PATH = os.path.join(DATA_DIR, "actions.jsonl")
+
+
+def data_glob(data_dir: str = DATA_DIR) -> str:
+    return os.path.join(data_dir, "**", "*.jsonl")
+
+
+DATA_GLOB = data_glob()
+
+
+def shard_paths(files: str = DATA_GLOB) -> list[str]:
+    return sorted(glob.glob(files, recursive=True))
+
+
+def iter_shard(path: str):
+    """Yield the actions stored in one JSONL shard.
+
+    Blank and undecodable lines are skipped so a partially written line does
+    not abort a reader.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    obj = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(obj, dict) and isinstance(obj.get("id"), str):
+                    yield obj
+    except FileNotFoundError:
+        return
+
+
+def iter_actions(files: str = DATA_GLOB):
+    """Yield stored actions one at a time, shard by shard."""
+    for path in shard_paths(files):
+        yield from iter_shard(path)
+
+
+def make_id(path: list[str]) -> str:
+    """Mirror the bookmarklet's makeId: join segments and slugify."""
+    joined = ":".join(path).lower()
+    return re.sub(r"[^a-z0-9:.-]", "", re.sub(r"\s+", "-", joined))
+
+
+def in_subtree(node_id: str, root_id: str) -> bool:
+    """Node ids are joined path segments, so a subtree is an id prefix."""
+    return node_id == root_id or node_id.startswith(f"{root_id}:")
+
+
+class Snapshot:
+    """One immutable generation of the stored tree.
+
+    Readers hold on to a snapshot for as long as they need it; writers never
+    modify it but publish a new one, so a render or export sees one
+    consistent tree while ingest carries on.
+    """
+
+    __slots__ = ("generation", "nodes", "hashes")
+
+    def __init__(
+        self, generation: int, nodes: ChunkedMap, hashes: subtree_hash.SubtreeHashes
+    ) -> None:
+        self.generation = generation
+        self.nodes = nodes.freeze()
+        self.hashes = hashes
+
+    def tree(self) -> dict:
+        return {"nodes": self.nodes, "edges": jsonl_to_tree.tree_edges(self.nodes)}
+
+    def actions(self):
+        for node in self.nodes.values():
+            yield jsonl_to_tree.node_action(self.nodes, node)
+
+
+class ActionStore:
+    """Single commit path for writes, lock-free snapshots for reads.
+
+    Every mutation runs through commit(), which holds the writer lock while
+    it changes the shards and a thawed copy of the node map, then publishes
+    that copy as the next Snapshot. The copy shares every chunk the commit
+    did not touch, and the ids it did touch are passed on to the subtree
+    hashes and the coverage statistics, so a commit costs O(changed nodes)
+    rather than O(store). Readers only take the current snapshot reference.
+    Edits made to the shards outside the server are noticed through their
+    stat fingerprint, checked at most every `check_interval` seconds in a
+    background thread; readers keep the previous snapshot until the reload
+    has been published.
+    """
+
+    def __init__(self, files: str = DATA_GLOB, check_interval: float = 1.0) -> None:
+        self._files = files
+        self._lock = threading.Lock()
+        self._snapshot: Snapshot | None = None
+        self._stamps: dict | None = None
+        self._generation = 0
+        self._next_check = 0.0
+        self._refreshing = False
+        self.check_interval = check_interval
+        self.stats = tree_stats.TreeStats()
+
+    def _fingerprint(self) -> dict:
+        stamps = {}
+        for path in shard_paths(self._files):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def _publish(self, nodes: ChunkedMap, hashes, stamps: dict | None = None) -> None:
+        self._generation += 1
+        self._stamps = self._fingerprint() if stamps is None else stamps
+        self._next_check = time.monotonic() + self.check_interval
+        self._snapshot = Snapshot(self._generation, nodes, hashes)
+
+    def _ensure_current(self) -> None:
+        stamps = self._fingerprint()
+        self._next_check = time.monotonic() + self.check_interval
+        if self._snapshot is None or stamps != self._stamps:
+            nodes = ChunkedMap(
+                jsonl_to_tree.normalize_nodes(iter_actions(self._files))
+            )
+            self._publish(nodes, subtree_hash.build_hashes(nodes), stamps)
+            self.stats = tree_stats.TreeStats.build(nodes, self._generation)
+
+    def _refresh(self) -> None:
+        try:
+            with self._lock:
+                self._ensure_current()
+        finally:
+            self._refreshing = False
+
+    def snapshot(self, wait: bool = True) -> Snapshot | None:
+        """The current snapshot, without touching the disk once there is one.
+
+        When the fingerprint is due to be checked, a background thread does
+        so (and reloads if needed) while this call returns the snapshot as
+        it is. Only the very first call has to load; it does so inline, or
+        returns None with `wait=False` so async callers can load in a worker.
+        """
+        snap = self._snapshot
+        if snap is None:
+            if not wait:
+                return None
+            with self._lock:
+                self._ensure_current()
+                return self._snapshot
+        if not self._refreshing and time.monotonic() >= self._next_check:
+            self._refreshing = True
+            threading.Thread(
+                target=self._refresh, name="action-store-refresh", daemon=True
+            ).start()
+        return snap
+
+    def commit(self, apply):
+        """Run `apply(nodes)` under the writer lock and publish its result.
+
+        `apply` persists the change to the shards and mirrors it into
+        `nodes`, a thawed copy of the current node map that records the ids
+        it sets or deletes. Its return value is passed through. If it raises,
+        nothing is published; the next access reloads from disk only if the
+        shards were modified before the error.
+        """
+        with self._lock:
+            self._ensure_current()
+            current = self._snapshot
+            nodes = current.nodes.thaw()
+            try:
+                result = apply(nodes)
+            except BaseException:
+                if self._fingerprint() != self._stamps:
+                    self._stamps = None
+                    self._next_check = 0.0
+                raise
+            changed = list(nodes.changed)
+            self._publish(nodes, current.hashes.update(nodes, changed))
+            self.stats.apply(current.nodes, nodes, changed, self._generation)
+            return result
+
+
+store = ActionStore()
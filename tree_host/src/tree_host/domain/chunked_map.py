@@ -0,0 +1,166 @@
+from collections.abc import Mapping
+from itertools import chain
+
+SEGMENT_SIZE = 512
+
+
+class ChunkedMap(Mapping):
+    """Insertion-ordered map whose copies share their unchanged chunks.
+
+    Values live in ordered segments of up to SEGMENT_SIZE keys, and a
+    hashed set of buckets maps each key to its segment. Both are small
+    dicts, so thaw() only copies the two lists of them, about sqrt(n)
+    references. A write then copies just the one segment and one bucket it
+    touches. Published maps are frozen; writers thaw a private copy, which
+    records every key it sets or deletes in `changed`.
+    """
+
+    __slots__ = (
+        "_segments",
+        "_buckets",
+        "_len",
+        "_own_segments",
+        "_own_buckets",
+        "_frozen",
+        "changed",
+    )
+
+    def __init__(self, items=()) -> None:
+        self._segments: list[dict] = [{}]
+        self._buckets: list[dict] = [{} for _ in range(16)]
+        self._len = 0
+        self._own_segments: set[int] = {0}
+        self._own_buckets: set[int] = set(range(16))
+        self._frozen = False
+        self.changed: dict | None = None
+        for key, value in items.items() if isinstance(items, Mapping) else items:
+            self[key] = value
+
+    # -- reading ---------------------------------------------------------
+
+    def _bucket_of(self, key) -> int:
+        return hash(key) & (len(self._buckets) - 1)
+
+    def __getitem__(self, key):
+        segment = self._buckets[self._bucket_of(key)][key]
+        return self._segments[segment][key]
+
+    def get(self, key, default=None):
+        segment = self._buckets[self._bucket_of(key)].get(key)
+        if segment is None:
+            return default
+        return self._segments[segment][key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._buckets[self._bucket_of(key)]
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._segments)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return chain.from_iterable(s.values() for s in self._segments)
+
+    def items(self):
+        return chain.from_iterable(s.items() for s in self._segments)
+
+    # -- copies ----------------------------------------------------------
+
+    def freeze(self) -> "ChunkedMap":
+        self._frozen = True
+        return self
+
+    def thaw(self, track: bool = True) -> "ChunkedMap":
+        """Return a writable copy sharing every chunk with this frozen map.
+
+        With `track` the copy records changed keys in `changed`.
+        """
+        if not self._frozen:
+            raise TypeError("only a frozen ChunkedMap can be thawed")
+        copy = ChunkedMap.__new__(ChunkedMap)
+        copy._segments = list(self._segments)
+        copy._buckets = list(self._buckets)
+        copy._len = self._len
+        copy._own_segments = set()
+        copy._own_buckets = set()
+        copy._frozen = False
+        copy.changed = {} if track else None
+        return copy
+
+    # -- writing ---------------------------------------------------------
+
+    def _writable_segment(self, i: int) -> dict:
+        if i not in self._own_segments:
+            self._segments[i] = dict(self._segments[i])
+            self._own_segments.add(i)
+        return self._segments[i]
+
+    def _writable_bucket(self, i: int) -> dict:
+        if i not in self._own_buckets:
+            self._buckets[i] = dict(self._buckets[i])
+            self._own_buckets.add(i)
+        return self._buckets[i]
+
+    def _check_writable(self) -> None:
+        if self._frozen:
+            raise TypeError("ChunkedMap is frozen")
+
+    def __setitem__(self, key, value) -> None:
+        self._check_writable()
+        b = self._bucket_of(key)
+        segment = self._buckets[b].get(key)
+        if segment is None:
+            segment = len(self._segments) - 1
+            if len(self._segments[segment]) >= SEGMENT_SIZE:
+                segment += 1
+                self._segments.append({})
+                self._own_segments.add(segment)
+            self._writable_bucket(b)[key] = segment
+            self._len += 1
+        self._writable_segment(segment)[key] = value
+        if self.changed is not None:
+            self.changed[key] = None
+        if self._len > 2 * len(self._buckets) ** 2:
+            self._rebuild(4 * len(self._buckets))
+
+    def __delitem__(self, key) -> None:
+        self._check_writable()
+        segment = self._writable_bucket(self._bucket_of(key)).pop(key)
+        del self._writable_segment(segment)[key]
+        self._len -= 1
+        if self.changed is not None:
+            self.changed[key] = None
+        if len(self._segments) > 2 * (self._len // SEGMENT_SIZE) + 16:
+            self._rebuild(len(self._buckets))
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def _rebuild(self, buckets: int) -> None:
+        # Grow the buckets, or repack segments emptied by deletes. O(n), but
+        # only after the map grew fourfold or lost half its entries.
+        items = list(self.items())
+        self._segments = [{}]
+        self._buckets = [{} for _ in range(buckets)]
+        self._own_segments = {0}
+        self._own_buckets = set(range(buckets))
+        mask = buckets - 1
+        for key, value in items:
+            segment = len(self._segments) - 1
+            if len(self._segments[segment]) >= SEGMENT_SIZE:
+                segment += 1
+                self._segments.append({})
+                self._own_segments.add(segment)
+            self._segments[segment][key] = value
+            self._buckets[hash(key) & mask][key] = segment
@@ -1,26 +1,102 @@
 import json
 import glob
+import sys
 
 
-def _normalize_tree(actions):
-    edges = []
-    nodes = {}
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Node:
+    """One captured action, kept small and never mutated once published.
+
+    Labels, routes and types repeat across many nodes and are interned.
+    The path is not stored: a node keeps its own last segment and its
+    parent's id, and node_path rebuilds the full path by walking parents.
+    Only nodes whose parent was not stored when they were linked keep their
+    path prefix.
+    """
+
+    __slots__ = ("id", "title", "role", "route", "type", "segment", "parent", "prefix")
+    kind = "action"
+
+    def __init__(self, a: dict) -> None:
+        path = a.get("path") or []
+        self.id = a["id"]
+        self.title = _intern(a.get("title", "(action)"))
+        self.role = _intern(a.get("role"))
+        self.route = _intern(a.get("route"))
+        self.type = _intern(a.get("type"))
+        self.segment = _intern(path[-1]) if path else None
+        self.parent = a.get("parent") or None
+        self.prefix = tuple(_intern(p) for p in path[:-1])
+
+
+def link_parents(nodes: dict, linking=None) -> None:
+    """Drop the stored prefix of nodes whose parent is present.
+
+    The prefix is only dropped when it is the parent's path: ids are
+    slugified, so a parent with the same id may be spelled differently and
+    the node must keep the path it was stored with. The parent id is
+    swapped for the parent's own id string so the two share memory. Only
+    call this on nodes no snapshot has published yet.
+    """
+    for node in nodes.values() if linking is None else linking:
+        parent = nodes.get(node.parent) if node.parent else None
+        if parent is None:
+            continue
+        node.parent = parent.id
+        if (
+            node.prefix
+            and node.prefix[-1] == parent.segment
+            and list(node.prefix) == node_path(nodes, parent)
+        ):
+            node.prefix = None
+
 
+def node_path(nodes, node: Node) -> list[str]:
+    segments = []
+    seen = set()
+    while node is not None and node.id not in seen:
+        seen.add(node.id)
+        if node.segment is not None:
+            segments.append(node.segment)
+        if node.prefix is not None:
+            segments.extend(reversed(node.prefix))
+            break
+        node = nodes.get(node.parent) if node.parent else None
+    segments.reverse()
+    return segments
+
+
+def node_action(nodes, node: Node) -> dict:
+    """Rebuild the stored action shape of a node."""
+    return {
+        "id": node.id,
+        "parent": node.parent,
+        "path": node_path(nodes, node),
+        "title": node.title,
+        "route": node.route,
+        "type": node.type,
+        "role": node.role,
+    }
+
+
+def normalize_nodes(actions) -> dict:
+    nodes = {}
     for a in actions:
-        nid = a["id"]
-        nodes[nid] = {
-            "id": nid,
-            "title": a.get("title", "(action)"),
-            "kind": "action",
-            "role": a.get("role"),
-            "route": a.get("route"),
-            "type": a.get("type"),
-            "path": a.get("path", []),
-        }
-        if a.get("parent"):
-            edges.append((a["parent"], nid))
-
-    return nodes, edges
+        nodes[a["id"]] = Node(a)
+    link_parents(nodes)
+    return nodes
+
+
+def tree_edges(nodes) -> list[tuple[str, str]]:
+    return [(n.parent, n.id) for n in nodes.values() if n.parent]
+
+
+def _normalize_tree(actions):
+    nodes = normalize_nodes(actions)
+    return nodes, tree_edges(nodes)
 
 
 def _load_lines(file_paths):
@@ -35,6 +111,5 @@ def _load_lines(file_paths):
 
 def build_tree(files: str) -> dict:
     input_paths = glob.glob(files, recursive=True)
-    all_actions = list(_load_lines(input_paths))
-    nodes, edges = _normalize_tree(all_actions)
+    nodes, edges = _normalize_tree(_load_lines(input_paths))
     return {"nodes": nodes, "edges": edges}
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+
+from tree_host.domain import action_store, jsonl_to_tree, tree_visualizer
+from tree_host.response.html import TEMPLATE_PATH, render_html
+
+MANIFEST_NAME = "manifest.json"
+PAGE_NAME = "index.html"
+CYTOSCAPE_NAME = "cytoscape.min.js"
+# Earlier builds kept the shard cache inside the bundle.
+_BUNDLED_CACHE_DIR = ".shards"
+# Bump when the cached shard elements or the page layout change shape.
+BUILD_VERSION = 4
+
+
+@dataclass
+class BuildReport:
+    shards_total: int = 0
+    shards_reused: int = 0
+    shards_processed: list[str] = field(default_factory=list)
+    page_written: bool = False
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    dir_name = os.path.dirname(path) or "."
+    with tempfile.NamedTemporaryFile("wb", dir=dir_name, delete=False) as tmp:
+        tmp.write(data)
+        tmp_path = tmp.name
+    os.replace(tmp_path, path)
+
+
+def _load_manifest(out_dir: str) -> dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if manifest.get("version") != BUILD_VERSION:
+        return {}
+    return manifest
+
+
+def _shard_digest(path: str, previous: dict | None) -> dict:
+    """Return the manifest entry for a shard, hashing only if it was touched."""
+    st = os.stat(path)
+    if (
+        previous
+        and previous.get("size") == st.st_size
+        and previous.get("mtime_ns") == st.st_mtime_ns
+    ):
+        return previous
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": _sha256_file(path)}
+
+
+def _cache_name(shard: dict) -> str:
+    return f"{shard['sha256']}.v{BUILD_VERSION}.json"
+
+
+def default_cache_dir(out_dir: str) -> str:
+    """The shard cache sits next to the bundle so it is never published."""
+    return os.path.normpath(out_dir) + "-cache"
+
+
+def _shard_elements(path: str) -> dict:
+    # Same reader as the server, so a half-written last line is skipped.
+    nodes = jsonl_to_tree.normalize_nodes(action_store.iter_shard(path))
+    cy_nodes, _ = tree_visualizer.to_cytoscape_elements(nodes, [])
+    return {
+        "nodes": {n["data"]["id"]: n for n in cy_nodes},
+        "edges": [list(e) for e in jsonl_to_tree.tree_edges(nodes)],
+    }
+
+
+def build_static_site(
+    data_dir: str,
+    out_dir: str,
+    cytoscape_js: str | None = None,
+    cache_dir: str | None = None,
+) -> BuildReport:
+    """Render the tree page from `data_dir` into a self-contained `out_dir`.
+
+    Every input shard is content-hashed into the manifest and its Cytoscape
+    elements are cached in `cache_dir` (default: default_cache_dir(out_dir),
+    outside the bundle) by content hash, so a rebuild only
+    re-parses shards whose content changed and skips writing the page when
+    no input changed at all. `cytoscape_js` is a local copy of
+    cytoscape.min.js that is shipped next to the page instead of the CDN
+    script; it may be omitted once a bundle already contains one. The page
+    is rendered without the parts that need the server (live reload over
+    /ws, delete, template expansion).
+    """
+    report = BuildReport()
+    if cache_dir is None:
+        cache_dir = default_cache_dir(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    shutil.rmtree(os.path.join(out_dir, _BUNDLED_CACHE_DIR), ignore_errors=True)
+
+    bundled_js = os.path.join(out_dir, CYTOSCAPE_NAME)
+    if cytoscape_js:
+        if not os.path.exists(bundled_js) or _sha256_file(
+            cytoscape_js
+        ) != _sha256_file(bundled_js):
+            shutil.copyfile(cytoscape_js, bundled_js)
+    elif not os.path.exists(bundled_js):
+        raise FileNotFoundError(
+            f"{bundled_js} is missing; pass a local cytoscape.min.js to bundle"
+        )
+
+    previous = _load_manifest(out_dir)
+    previous_shards = previous.get("shards", {})
+    shards: dict[str, dict] = {}
+    for path in action_store.shard_paths(action_store.data_glob(data_dir)):
+        rel = os.path.relpath(path, data_dir)
+        shards[rel] = _shard_digest(path, previous_shards.get(rel))
+    report.shards_total = len(shards)
+
+    page_key = hashlib.sha256(
+        json.dumps(
+            {
+                "template": _sha256_file(TEMPLATE_PATH),
+                "shards": [[rel, s["sha256"]] for rel, s in shards.items()],
+            }
+        ).encode("utf-8")
+    ).hexdigest()
+    page_path = os.path.join(out_dir, PAGE_NAME)
+
+    if previous.get("page") == page_key and os.path.exists(page_path):
+        report.shards_reused = len(shards)
+    else:
+        nodes: dict[str, dict] = {}
+        edges: list = []
+        for rel, s in shards.items():
+            cache_path = os.path.join(cache_dir, _cache_name(s))
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    elements = json.load(f)
+                report.shards_reused += 1
+            except (FileNotFoundError, json.JSONDecodeError):
+                elements = _shard_elements(os.path.join(data_dir, rel))
+                _write_atomic(
+                    cache_path,
+                    json.dumps(elements, ensure_ascii=False).encode("utf-8"),
+                )
+                report.shards_processed.append(rel)
+            nodes.update(elements["nodes"])
+            edges.extend(tuple(e) for e in elements["edges"])
+
+        _, cy_edges = tree_visualizer.to_cytoscape_elements({}, edges)
+        script = tree_visualizer.cytoscape_script(
+            list(nodes.values()), cy_edges, live=False
+        )
+        page = render_html(script, cytoscape_src=CYTOSCAPE_NAME, live=False)
+        _write_atomic(page_path, page.encode("utf-8"))
+        report.page_written = True
+
+    live = {_cache_name(s) for s in shards.values()}
+    for name in os.listdir(cache_dir):
+        if name not in live:
+            os.remove(os.path.join(cache_dir, name))
+
+    manifest = {"version": BUILD_VERSION, "page": page_key, "shards": shards}
+    _write_atomic(
+        os.path.join(out_dir, MANIFEST_NAME),
+        json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"),
+    )
+    return report
@@ -0,0 +1,183 @@
+import hashlib
+import heapq
+import json
+
+from tree_host.domain.chunked_map import ChunkedMap
+
+_MASK = (1 << 128) - 1
+TEMPLATE_PREFIX = "tpl:"
+
+
+def _label_hash(node, below: int) -> int:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(
+        json.dumps([node.title, node.type, node.role, node.route], ensure_ascii=False)
+        .encode("utf-8")
+    )
+    h.update(below.to_bytes(16, "big"))
+    return int.from_bytes(h.digest(), "big")
+
+
+class SubtreeHashes:
+    """Merkle hashes of every subtree, by shape and labels.
+
+    A node's hash covers its own title, type, role and route plus the sum of
+    its children's hashes, so equal hashes mean equal subtrees regardless of
+    sibling order. Because the children enter as a sum, a changed child only
+    moves its parent's sum by the difference: update() rehashes just the
+    changed nodes and their ancestors. Sums are kept per parent id, also for
+    parents that were not captured (yet), so a late parent picks up its
+    children without a scan. All three maps are ChunkedMaps, so update()
+    shares everything it does not touch with the instance it started from.
+    """
+
+    __slots__ = ("_contrib", "_below", "counts")
+
+    def __init__(self) -> None:
+        # id -> (parent id, subtree hash, subtree size) as added to _below
+        self._contrib = ChunkedMap().freeze()
+        # parent id -> (sum of child hashes, sum of child sizes)
+        self._below = ChunkedMap().freeze()
+        # subtree hash -> number of nodes rooted at such a subtree
+        self.counts = ChunkedMap().freeze()
+
+    def hash(self, node_id: str) -> int | None:
+        c = self._contrib.get(node_id)
+        return c[1] if c else None
+
+    def size(self, node_id: str) -> int:
+        c = self._contrib.get(node_id)
+        return c[2] if c else 0
+
+    def _add(self, parent, h: int, size: int, sign: int) -> None:
+        if not parent:
+            return
+        hs, ss = self._below.get(parent, (0, 0))
+        hs, ss = (hs + sign * h) & _MASK, ss + sign * size
+        if ss:
+            self._below[parent] = (hs, ss)
+        else:
+            self._below.pop(parent, None)
+
+    def _count(self, h: int, sign: int) -> None:
+        n = self.counts.get(h, 0) + sign
+        if n:
+            self.counts[h] = n
+        else:
+            del self.counts[h]
+
+    def update(self, nodes, changed) -> "SubtreeHashes":
+        """Return a copy brought up to date with `nodes`.
+
+        `changed` lists the ids that were added, removed or replaced since
+        this instance was current. The instance itself is left untouched so
+        snapshots holding it stay consistent.
+        """
+        new = SubtreeHashes.__new__(SubtreeHashes)
+        new._contrib = self._contrib.thaw(track=False)
+        new._below = self._below.thaw(track=False)
+        new.counts = self.counts.thaw(track=False)
+
+        depths: dict[str, int] = {}
+
+        def depth(node_id: str) -> int:
+            chain, on_chain = [], set()
+            cur = node_id
+            while cur in nodes and cur not in depths and cur not in on_chain:
+                chain.append(cur)
+                on_chain.add(cur)
+                cur = nodes[cur].parent
+            d = depths.get(cur, 0)
+            for nid in reversed(chain):
+                d += 1
+                depths[nid] = d
+            return depths[node_id]
+
+        dirty: list[tuple[int, str]] = []
+        queued: set[str] = set()
+
+        def push(node_id) -> None:
+            if node_id in nodes and node_id not in queued:
+                queued.add(node_id)
+                heapq.heappush(dirty, (-depth(node_id), node_id))
+
+        for node_id in changed:
+            old = new._contrib.pop(node_id, None)
+            if old is not None:
+                new._add(old[0], old[1], old[2], -1)
+                new._count(old[1], -1)
+                push(old[0])
+            push(node_id)
+
+        # Deepest first, so every node is rehashed once after its children.
+        while dirty:
+            _, node_id = heapq.heappop(dirty)
+            node = nodes[node_id]
+            hs, ss = new._below.get(node_id, (0, 0))
+            contrib = (node.parent, _label_hash(node, hs), ss + 1)
+            old = new._contrib.get(node_id)
+            if old == contrib:
+                continue
+            if old is not None:
+                new._add(old[0], old[1], old[2], -1)
+                new._count(old[1], -1)
+            new._contrib[node_id] = contrib
+            new._add(contrib[0], contrib[1], contrib[2], 1)
+            new._count(contrib[1], 1)
+            push(contrib[0])
+        new._contrib.freeze()
+        new._below.freeze()
+        new.counts.freeze()
+        return new
+
+
+def build_hashes(nodes) -> SubtreeHashes:
+    return SubtreeHashes().update(nodes, list(nodes))
+
+
+def collapse_repeats(nodes, hashes: SubtreeHashes, min_count: int = 2, root=None):
+    """Fold repeated subtrees of the tree (or of `root`'s subtree) into templates.
+
+    Every subtree of at least two nodes whose hash occurs `min_count` times
+    or more is not descended into: its parent gets an edge to one template
+    node per hash instead. Returns the nodes still shown, the edges (sources
+    and targets may be template ids) and the templates as
+    {template id: (first occurrence node, occurrences, subtree size)}. When
+    `root` is given only its descendants are returned, with `root` itself
+    never folded.
+    """
+    children: dict[str, list[str]] = {}
+    for n in nodes.values():
+        if n.parent:
+            children.setdefault(n.parent, []).append(n.id)
+
+    if root is None:
+        stack = [n.id for n in nodes.values() if n.parent not in nodes]
+    else:
+        stack = list(children.get(root, ()))
+    stack.reverse()
+
+    shown: dict = {}
+    edges: list[tuple[str, str]] = []
+    templates: dict[str, tuple] = {}
+    seen: set[str] = set()
+    while stack:
+        node_id = stack.pop()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        node = nodes[node_id]
+        h = hashes.hash(node_id)
+        size = hashes.size(node_id)
+        if min_count and h is not None and size > 1 and hashes.counts[h] >= min_count:
+            tpl = f"{TEMPLATE_PREFIX}{h:032x}"
+            templates.setdefault(tpl, (node, hashes.counts[h], size))
+            if node.parent:
+                edges.append((node.parent, tpl))
+            continue
+        shown[node_id] = node
+        if node.parent:
+            edges.append((node.parent, node_id))
+        stack.extend(reversed(children.get(node_id, ())))
+    # Several occurrences under one parent share a single edge.
+    return shown, list(dict.fromkeys(edges)), templates
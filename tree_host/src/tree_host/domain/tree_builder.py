@@ -2,24 +2,94 @@ import glob
 import json
 import os
 import tempfile
+import time
 
-from tree_host.domain import jsonl_to_tree, tree_visualizer
+from tree_host.domain import (
+    action_index,
+    action_store,
+    jsonl_to_tree,
+    subtree_hash,
+    tree_visualizer,
+)
 from tree_host.response.html import render_html
 
+# Subtrees repeated at least this often are folded into one template node
+# on the page; 0 renders every node.
+try:
+    DEDUP_MIN = int(os.environ.get("TREE_HOST_DEDUP_MIN", 2))
+except ValueError:
+    DEDUP_MIN = 2
 
-def build_tree_html() -> str:
-    tree = jsonl_to_tree.build_tree("./data/**/*.jsonl")
+# Sentinel for "keep the current parent" in move_tree_node.
+KEEP_PARENT = object()
+
+
+class MoveConflictError(Exception):
+    """Moving a subtree would overwrite nodes that are not part of it."""
+
+
+def build_tree_html(snapshot: action_store.Snapshot | None = None) -> str:
+    if snapshot is None:
+        snapshot = action_store.store.snapshot()
+    tree = collapsed_tree(snapshot)
     tree_html = tree_visualizer.visualize_tree(tree)
     full_page = render_html(tree_html)
     return full_page
 
 
-def delete_tree_node(node_id: str) -> int:
+def collapsed_tree(snapshot: action_store.Snapshot, root: str | None = None) -> dict:
+    """The tree (or `root`'s descendants) with repeated subtrees folded."""
+    if root is not None and root not in snapshot.nodes:
+        raise KeyError(root)
+    if not DEDUP_MIN and root is None:
+        return snapshot.tree()
+    nodes, edges, templates = subtree_hash.collapse_repeats(
+        snapshot.nodes, snapshot.hashes, DEDUP_MIN, root
+    )
+    return {"nodes": nodes, "edges": edges, "templates": templates}
+
+
+def subtree_elements(snapshot: action_store.Snapshot, root: str) -> dict:
+    """Cytoscape elements below `root`, for expanding a template on the page."""
+    tree = collapsed_tree(snapshot, root)
+    cy_nodes, cy_edges = tree_visualizer.to_cytoscape_elements(
+        tree["nodes"], tree["edges"], tree["templates"]
+    )
+    return {"nodes": cy_nodes, "edges": cy_edges}
+
+
+def append_action(action: dict, nodes=None) -> None:
+    """Append one captured action to the live shard.
+
+    `nodes` is the node map being committed; the new node is added to it.
+    """
+    file_path = action_store.ACTIONS_PATH
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Arrival time lets captures be replayed at their original pace.
+    line = json.dumps({**action, "ts": round(time.time(), 3)}).encode("utf-8")
+    with open(file_path, "ab") as f:
+        offset = f.tell()
+        f.write(line + b"\n")
+    action_index.index.note_append(file_path, action["id"], offset, len(line))
+    if nodes is not None:
+        node = nodes[action["id"]] = jsonl_to_tree.Node(action)
+        jsonl_to_tree.link_parents(nodes, [node])
+
+
+def delete_tree_node(node_id: str, nodes=None) -> int:
     if not node_id:
         return 0
 
+    index = action_index.index
+    if nodes is not None:
+        # Read the prefix range before the rewrite invalidates the index.
+        index.ensure_fresh()
+        doomed = index.descendants(node_id)
+        if node_id in index:
+            doomed.append(node_id)
+
     total_deleted = 0
-    for path in glob.glob("./data/**/*.jsonl", recursive=True):
+    for path in glob.glob(action_store.DATA_GLOB, recursive=True):
         # Read all lines once
         try:
             with open(path, "r", encoding="utf-8") as f:
@@ -39,9 +109,7 @@ def delete_tree_node(node_id: str) -> int:
                 kept.append(line)
                 continue
             oid = obj.get("id")
-            if isinstance(oid, str) and (
-                oid == node_id or oid.startswith(f"{node_id}:")
-            ):
+            if isinstance(oid, str) and action_store.in_subtree(oid, node_id):
                 deleted_here += 1
                 continue
             kept.append(json.dumps(obj, ensure_ascii=False))
@@ -58,4 +126,137 @@ def delete_tree_node(node_id: str) -> int:
             os.replace(tmp_path, path)
             total_deleted += deleted_here
 
+    if total_deleted:
+        index.invalidate()
+    if nodes is not None:
+        for nid in doomed:
+            nodes.pop(nid, None)
     return total_deleted
+
+
+def _copy_range(src, dst, length: int) -> None:
+    while length > 0:
+        chunk = src.read(min(length, 1 << 20))
+        if not chunk:
+            break
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def move_tree_node(
+    node_id: str,
+    new_parent=KEEP_PARENT,
+    new_title: str | None = None,
+    nodes=None,
+):
+    """Move and/or retitle the subtree rooted at `node_id`.
+
+    Ids, parent links and paths of every record in the subtree are rewritten
+    to hang below `new_parent` (None for a top-level node) under `new_title`.
+    The subtree is located through the prefix index, only its records are
+    decoded and re-encoded, and the touched shards are swapped in with
+    os.replace once all of them have been written. If `nodes` is given, the
+    moved nodes are replaced in it as well. Returns the new root id and the
+    number of records rewritten.
+    """
+    index = action_index.index
+    index.ensure_fresh()
+    subtree = index.subtree(node_id)
+    if not subtree:
+        raise KeyError(node_id)
+    root = index.read(node_id)
+    old_path = root.get("path") or [root.get("title", "")]
+
+    if new_parent is KEEP_PARENT:
+        # The parent may never have been captured (the bookmarklet derives
+        # it from the typed path), so take its path from the node's own.
+        new_parent = root.get("parent") or None
+        parent_path = old_path[:-1]
+    elif new_parent is not None:
+        if action_store.in_subtree(new_parent, node_id):
+            raise ValueError("cannot move a node below itself")
+        if new_parent not in index:
+            raise KeyError(new_parent)
+        parent_path = index.read(new_parent).get("path") or []
+    else:
+        parent_path = []
+    title = new_title if new_title is not None else old_path[-1]
+    if not title.strip():
+        raise ValueError("title must not be empty")
+
+    segment = action_store.make_id([title])
+    if not segment:
+        raise ValueError("title must contain a letter or digit")
+    new_root = f"{new_parent}:{segment}" if new_parent else segment
+    if new_root != node_id and action_store.in_subtree(new_root, node_id):
+        raise ValueError("new id would fall inside the moved subtree")
+
+    new_prefix = parent_path + [title]
+    renamed = {i: new_root + i[len(node_id):] for i in subtree}
+    # new_root need not be stored itself for records below it to be.
+    clashes = [
+        i for i in renamed.values()
+        if i in index and not action_store.in_subtree(i, node_id)
+    ]
+    if clashes:
+        raise MoveConflictError(f"{clashes[0]!r} already exists")
+    by_shard: dict[str, list[tuple[int, int, bytes]]] = {}
+    ids_by_shard: dict[str, dict[str, str]] = {}
+    latest: dict[str, dict] = {}
+    for old_id in subtree:
+        for path, offset, length in index.locations(old_id):
+            with open(path, "rb") as f:
+                f.seek(offset)
+                rec = json.loads(f.read(length))
+            rec["id"] = renamed[old_id]
+            if old_id == node_id:
+                rec["parent"] = new_parent
+                if new_title is not None:
+                    rec["title"] = new_title
+            elif isinstance(rec.get("parent"), str) and action_store.in_subtree(
+                rec["parent"], node_id
+            ):
+                # By prefix: intermediate parents are often not stored.
+                rec["parent"] = new_root + rec["parent"][len(node_id):]
+            rec["path"] = new_prefix + (rec.get("path") or [])[len(old_path):]
+            data = json.dumps(rec, ensure_ascii=False).encode("utf-8")
+            by_shard.setdefault(path, []).append((offset, length, data))
+            latest[old_id] = rec
+            ids_by_shard.setdefault(path, {})[old_id] = renamed[old_id]
+
+    written: list[tuple[str, str]] = []
+    try:
+        for path, edits in by_shard.items():
+            edits.sort()
+            dir_name = os.path.dirname(path) or "."
+            with open(path, "rb") as src, tempfile.NamedTemporaryFile(
+                "wb", dir=dir_name, delete=False
+            ) as tmp:
+                written.append((tmp.name, path))
+                pos = 0
+                for offset, length, data in edits:
+                    _copy_range(src, tmp, offset - pos)
+                    tmp.write(data)
+                    src.seek(offset + length)
+                    pos = offset + length
+                _copy_range(src, tmp, os.fstat(src.fileno()).st_size - pos)
+    except BaseException:
+        for tmp_path, _ in written:
+            os.unlink(tmp_path)
+        raise
+
+    for tmp_path, path in written:
+        os.replace(tmp_path, path)
+        index.note_rewrite(
+            path,
+            [(offset, length, len(data)) for offset, length, data in by_shard[path]],
+            ids_by_shard[path],
+        )
+    if nodes is not None:
+        for old_id in latest:
+            nodes.pop(old_id, None)
+        moved = [jsonl_to_tree.Node(rec) for rec in latest.values()]
+        for node in moved:
+            nodes[node.id] = node
+        jsonl_to_tree.link_parents(nodes, moved)
+    return new_root, sum(len(edits) for edits in by_shard.values())
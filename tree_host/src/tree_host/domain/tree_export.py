@@ -0,0 +1,197 @@
+import hashlib
+import itertools
+import json
+from typing import Callable, Iterable, Iterator
+from xml.sax.saxutils import escape, quoteattr
+
+from tree_host.domain import action_store, jsonl_to_tree
+
+ActionSource = Callable[[], Iterable[dict]]
+
+MEDIA_TYPES = {
+    "dot": "text/vnd.graphviz; charset=utf-8",
+    "graphml": "application/graphml+xml; charset=utf-8",
+    "mermaid": "text/plain; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+}
+EXTENSIONS = {"dot": "dot", "graphml": "graphml", "mermaid": "mmd", "json": "json"}
+FORMATS = tuple(MEDIA_TYPES)
+
+
+def stored_actions(files: str = action_store.DATA_GLOB) -> Iterator[dict]:
+    """Yield every stored action once, in the shape the server exports.
+
+    Re-captured ids resolve like they do in the store and on the page: the
+    last record wins. That needs the whole node map, so a pass holds
+    O(nodes) in memory.
+    """
+    nodes = jsonl_to_tree.normalize_nodes(action_store.iter_actions(files))
+    for node in nodes.values():
+        yield jsonl_to_tree.node_action(nodes, node)
+
+
+def _select(
+    source: ActionSource, root: str | None, depth: int | None
+) -> Iterator[tuple[dict, str | None]]:
+    """Yield (action, parent_id) for every action inside the export window.
+
+    parent_id is None for the top of the export (the subtree root, or actions
+    without a parent). `source` must yield each id once.
+    """
+    base = 1
+    if root is not None:
+        root_action = next((a for a in source() if a["id"] == root), None)
+        if root_action is None:
+            raise KeyError(root)
+        base = len(root_action.get("path") or [])
+
+    def generate():
+        for a in source():
+            nid = a["id"]
+            if root is not None and not action_store.in_subtree(nid, root):
+                continue
+            if depth is not None and len(a.get("path") or []) - base > depth:
+                continue
+            parent = None if nid == root else a.get("parent") or None
+            yield a, parent
+
+    return generate()
+
+
+def _fields(a: dict) -> dict:
+    return {
+        "id": a["id"],
+        "title": a.get("title", "(action)"),
+        "route": a.get("route"),
+        "type": a.get("type"),
+        "path": a.get("path", []),
+    }
+
+
+def _dot_quote(s: str) -> str:
+    s = s.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{s}"'
+
+
+def _to_dot(selected):
+    yield "digraph tree {\n"
+    yield "  node [shape=ellipse];\n"
+    for a, parent in selected:
+        nid = _dot_quote(a["id"])
+        yield f"  {nid} [label={_dot_quote(a.get('title', '(action)'))}];\n"
+        if parent:
+            yield f"  {_dot_quote(parent)} -> {nid};\n"
+    yield "}\n"
+
+
+def _to_graphml(selected):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    for key in ("title", "route", "type", "path"):
+        yield f'  <key id="{key}" for="node" attr.name="{key}" attr.type="string"/>\n'
+    yield '  <graph id="tree" edgedefault="directed">\n'
+    for a, parent in selected:
+        f = _fields(a)
+        f["path"] = " > ".join(f["path"])
+        yield f'    <node id={quoteattr(a["id"])}>'
+        for key in ("title", "route", "type", "path"):
+            if f[key]:
+                yield f'<data key="{key}">{escape(str(f[key]))}</data>'
+        yield "</node>\n"
+        if parent:
+            yield f"    <edge source={quoteattr(parent)} target={quoteattr(a['id'])}/>\n"
+    yield "  </graph>\n"
+    yield "</graphml>\n"
+
+
+def _mermaid_id(node_id: str) -> str:
+    # Mermaid ids must be plain identifiers; hashing keeps them stable without
+    # an id table.
+    return "n" + hashlib.blake2b(node_id.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _mermaid_label(s: str) -> str:
+    for ch, entity in (('"', "#quot;"), ("<", "#lt;"), (">", "#gt;")):
+        s = s.replace(ch, entity)
+    return s.replace("\n", " ")
+
+
+def _to_mermaid(selected):
+    yield "flowchart TD\n"
+    for a, parent in selected:
+        mid = _mermaid_id(a["id"])
+        yield f'    {mid}["{_mermaid_label(a.get("title", "(action)"))}"]\n'
+        if parent:
+            yield f"    {_mermaid_id(parent)} --> {mid}\n"
+
+
+def _to_json(selected):
+    # Nesting needs every child under its parent, so this is the one format
+    # that holds the selection: grouped by parent id, in source order.
+    # Actions whose parent is not exported (top level, subtree root or an
+    # orphan) start a top-level object. Output is still written
+    # incrementally with an explicit stack instead of a nested dict.
+    children: dict[str | None, list[dict]] = {}
+    for a, parent in selected:
+        children.setdefault(parent, []).append(_fields(a))
+    ids = {f["id"] for group in children.values() for f in group}
+    tops = [f for p, group in children.items() if p is None or p not in ids for f in group]
+    # Anything left over afterwards sits on a parent cycle; it is written
+    # at the top level too rather than dropped.
+    rest = (f for group in children.values() for f in group)
+
+    written: set[str] = set()
+    first = True
+    yield "["
+    for top in itertools.chain(tops, rest):
+        if top["id"] in written:
+            continue
+        stack = [iter([top])]
+        while stack:
+            f = next(stack[-1], None)
+            if f is None:
+                stack.pop()
+                if stack:
+                    yield "]}"
+                first = False
+                continue
+            if f["id"] in written:
+                continue
+            written.add(f["id"])
+            if not first:
+                yield ","
+            yield json.dumps(f, ensure_ascii=False)[:-1] + ', "children": ['
+            stack.append(iter(children.get(f["id"], ())))
+            first = True
+    yield "]\n"
+
+
+_WRITERS = {
+    "dot": _to_dot,
+    "graphml": _to_graphml,
+    "mermaid": _to_mermaid,
+    "json": _to_json,
+}
+
+
+def export_tree(
+    fmt: str,
+    root: str | None = None,
+    depth: int | None = None,
+    source: ActionSource = stored_actions,
+) -> Iterator[str]:
+    """Return an iterator of text chunks rendering the stored tree as `fmt`.
+
+    `source` is called for a fresh pass over the actions, each id once
+    (twice when `root` is given). Output is written incrementally, but
+    memory is not constant: the source holds the node map and the JSON
+    writer also holds the selection to nest it. Raises ValueError for an
+    unknown format and KeyError when `root` is not a stored node; both are
+    raised before anything is yielded.
+    """
+    writer = _WRITERS.get(fmt)
+    if writer is None:
+        raise ValueError(f"unknown export format: {fmt}")
+    if depth is not None and depth < 0:
+        raise ValueError("depth must be >= 0")
+    return writer(_select(source, root, depth))
@@ -0,0 +1,148 @@
+import threading
+from collections import Counter
+
+from tree_host.domain import jsonl_to_tree
+
+
+def _dec(counter: Counter, key) -> None:
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+class _Counted:
+    """Ids currently counted while TreeStats.apply is half way through."""
+
+    def __init__(self, nodes) -> None:
+        self.nodes = nodes
+        self.pending: set[str] = set()
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self.nodes and node_id not in self.pending
+
+
+class TreeStats:
+    """Capture coverage aggregates, kept current by the writer.
+
+    Node counts per route and per type, the depth histogram (by path
+    length) and the fan-out histogram are adjusted for each node a commit
+    adds or removes, so a mutation costs O(nodes it touches). Children are
+    kept per parent id whether or not that parent was captured; the parents
+    that are missing form the orphan index.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.nodes = 0
+        self.by_route: Counter = Counter()
+        self.by_type: Counter = Counter()
+        self.depth: Counter = Counter()
+        self.fanout: Counter = Counter()
+        self._depths: dict[str, int] = {}
+        self._children: dict[str, set[str]] = {}
+        self._missing: set[str] = set()
+        self._orphans = 0
+
+    @classmethod
+    def build(cls, nodes, generation: int = 0) -> "TreeStats":
+        stats = cls()
+        stats.apply({}, nodes, list(nodes), generation)
+        return stats
+
+    def _fanout_of(self, node_id: str) -> int:
+        return len(self._children.get(node_id, ()))
+
+    def _remove(self, present, node) -> None:
+        self.nodes -= 1
+        _dec(self.by_route, node.route)
+        _dec(self.by_type, node.type)
+        _dec(self.depth, self._depths.pop(node.id))
+        _dec(self.fanout, self._fanout_of(node.id))
+        if node.id in self._children:
+            self._missing.add(node.id)
+            self._orphans += len(self._children[node.id])
+        parent = node.parent
+        if not parent:
+            return
+        siblings = self._children[parent]
+        if parent in present:
+            _dec(self.fanout, len(siblings))
+            self.fanout[len(siblings) - 1] += 1
+        else:
+            self._orphans -= 1
+        siblings.discard(node.id)
+        if not siblings:
+            del self._children[parent]
+            self._missing.discard(parent)
+
+    def _add(self, present, node, depth: int) -> None:
+        self.nodes += 1
+        self.by_route[node.route] += 1
+        self.by_type[node.type] += 1
+        self._depths[node.id] = depth
+        self.depth[depth] += 1
+        self.fanout[self._fanout_of(node.id)] += 1
+        if node.id in self._missing:
+            self._missing.discard(node.id)
+            self._orphans -= len(self._children[node.id])
+        parent = node.parent
+        if not parent:
+            return
+        siblings = self._children.setdefault(parent, set())
+        if parent in present:
+            _dec(self.fanout, len(siblings))
+            siblings.add(node.id)
+            self.fanout[len(siblings)] += 1
+        else:
+            siblings.add(node.id)
+            self._missing.add(parent)
+            self._orphans += 1
+
+    def _depth_of(self, nodes, node) -> int:
+        if node.prefix is None and node.parent in self._depths:
+            return self._depths[node.parent] + (node.segment is not None)
+        return len(jsonl_to_tree.node_path(nodes, node))
+
+    def apply(self, before, after, changed, generation: int) -> None:
+        """Move the aggregates from node map `before` to `after`.
+
+        `changed` lists the ids the commit set or deleted, as recorded by
+        the thawed node map, so no full-map diff is needed. Old versions
+        are removed first, then new ones added; a parent counts as present
+        while its old version is still counted or once its new one is.
+        """
+        with self._lock:
+            counted = _Counted(before)
+            for node_id in changed:
+                node = before.get(node_id)
+                if node is not None:
+                    self._remove(counted, node)
+                    counted.pending.add(node_id)
+            counted.nodes, counted.pending = after, set(changed)
+            for node_id in changed:
+                node = after.get(node_id)
+                if node is not None:
+                    counted.pending.discard(node_id)
+                    self._add(counted, node, self._depth_of(after, node))
+            self.generation = generation
+
+    def orphans(self, limit: int | None = None) -> list[dict]:
+        """Missing parent ids with the captured children that point at them."""
+        with self._lock:
+            groups = [(p, sorted(self._children[p])) for p in self._missing]
+        groups.sort(key=lambda g: (-len(g[1]), g[0]))
+        return [{"parent": p, "children": c} for p, c in groups[:limit]]
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "nodes": self.nodes,
+                "by_route": dict(self.by_route.most_common()),
+                "by_type": dict(self.by_type.most_common()),
+                "depth": dict(sorted(self.depth.items())),
+                "fanout": dict(sorted(self.fanout.items())),
+                "orphans": self._orphans,
+                "missing_parents": len(self._missing),
+            }
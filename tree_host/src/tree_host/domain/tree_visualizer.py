@@ -1,32 +1,141 @@
 import json
 
 
-def to_cytoscape_fragment(nodes, edges):
-    """Return only the JS needed to render the tree in an existing template.
+# Page code that needs the server behind it.
+_LIVE_SCRIPT = """
+  // Repeated subtrees arrive folded into one template node; its structure
+  // (that of the first occurrence) is fetched when it is first clicked. The
+  // expanded nodes stand for every occurrence, so they get ids of their own
+  // below the template and are read-only.
+  async function expandTemplate(n) {
+    if (n.data('kind') !== 'template' || n.data('expanded')) return;
+    n.data('expanded', true);
+    try {
+      const res = await fetch('/elements?root=' + encodeURIComponent(n.data('rep')));
+      if (!res.ok) throw new Error(res.statusText);
+      const more = await res.json();
+      const rep = n.data('rep');
+      const local = (id) => id === rep ? n.id() : (id.startsWith('tpl:') ? id : `${n.id()}/${id}`);
+      const add = [];
+      more.nodes.forEach(m => {
+        if (m.data.kind !== 'template') {
+          m.data.was = m.data.kind;
+          m.data.kind = 'template-child';
+          m.data.id = local(m.data.id);
+        }
+        if (cy.getElementById(m.data.id).empty()) add.push(m);
+      });
+      more.edges.forEach(e => {
+        e.data.source = local(e.data.source);
+        e.data.target = local(e.data.target);
+        e.data.id = `${e.data.source}->${e.data.target}`;
+        if (cy.getElementById(e.data.id).empty()) add.push(e);
+      });
+      cy.add(add);
+      cy.layout({ name: 'breadthfirst', directed: true, spacingFactor: 1.1, padding: 20 }).run();
+      applyFilters();
+    } catch (err) {
+      n.data('expanded', false);
+      console.error('Expand failed', err);
+    }
+    if (selected === n) updateInfo(n);
+  }
 
-    The template must provide:
-      - A <div id="cy"></div> container
-      - Controls with ids: q, fit, toggleActions, and an #info box
-      - The Cytoscape script included on the page
+  cy.on('tap', 'node', (evt) => { expandTemplate(evt.target); });
+
+  readOnlyNote = 'This node stands for every repeat of its subtree, so Delete is '
+    + 'disabled. Run the server with TREE_HOST_DEDUP_MIN=0 to draw and delete '
+    + 'individual nodes.';
+
+  // Delete selected node with Delete key
+  function isFormElement(el) {
+    return el && (el.tagName === 'INPUT' || el.tagName === 'TEXTAREA' || el.isContentEditable);
+  }
+  document.addEventListener('keydown', async (e) => {
+    if (e.key !== 'Delete') return;
+    if (isFormElement(document.activeElement)) return;
+    // Templates and their expansion stand for many nodes; never delete one.
+    if (!selected || ['template', 'template-child'].includes(selected.data('kind'))) return;
+    const id = selected.id();
+    try {
+      await fetch('/delete', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+  body: JSON.stringify({ id })
+      });
+      // Page will auto-reload via WebSocket broadcast
+    } catch (err) {
+      console.error('Delete failed', err);
+    }
+  });
+"""
+
+
+def to_cytoscape_elements(nodes, edges, templates=None):
+    """Return the Cytoscape node and edge element lists for a tree.
+
+    `templates` maps template ids to (first occurrence, occurrences, size)
+    as returned by subtree_hash.collapse_repeats; each becomes one
+    collapsed node standing in for all occurrences.
     """
 
     cy_nodes = []
     for n in nodes.values():
         data = {
-            "id": n["id"],
-            "label": n.get("title", ""),
-            "kind": n.get("kind", "node"),
-            "role": n.get("role"),
-            "route": n.get("route"),
-            "type": n.get("type"),
-            "path": " > ".join(n.get("path", [])) if n.get("path") else "",
+            "id": n.id,
+            "label": n.title,
+            "kind": n.kind,
+            "role": n.role,
+            "route": n.route,
+            "type": n.type,
+        }
+        # The page rebuilds paths from the edges; only send what differs
+        # from the label and the prefix of nodes without a stored parent.
+        if n.segment != n.title:
+            data["seg"] = n.segment or ""
+        if n.prefix:
+            data["prefix"] = " > ".join(n.prefix)
+        cy_nodes.append({"data": data})
+
+    for tpl, (n, count, size) in (templates or {}).items():
+        data = {
+            "id": tpl,
+            "label": f"{n.title} \u00d7{count}",
+            "seg": n.title,
+            "kind": "template",
+            "role": n.role,
+            "route": n.route,
+            "type": n.type,
+            "rep": n.id,
+            "count": count,
+            "size": size,
         }
         cy_nodes.append({"data": data})
 
     cy_edges = [
         {"data": {"id": f"{u}->{v}", "source": u, "target": v}} for (u, v) in edges
     ]
+    return cy_nodes, cy_edges
+
+
+def to_cytoscape_fragment(nodes, edges, templates=None):
+    """Return only the JS needed to render the tree in an existing template.
+
+    The template must provide:
+      - A <div id="cy"></div> container
+      - Controls with ids: q, fit, toggleActions, and an #info box
+      - The Cytoscape script included on the page
+    """
+    cy_nodes, cy_edges = to_cytoscape_elements(nodes, edges, templates)
+    return cytoscape_script(cy_nodes, cy_edges)
+
 
+def cytoscape_script(cy_nodes, cy_edges, live: bool = True):
+    """Return the <script> that builds the graph from prepared elements.
+
+    With `live` False the parts that talk to the server (expanding
+    templates, deleting with the Delete key) are left out.
+    """
     # Only return the script that sets up the graph using the provided DOM
     script = f"""
 <script>
@@ -52,6 +161,32 @@ def to_cytoscape_fragment(nodes, edges):
           'font-size': 12
         }}
       }},
+      {{
+        selector: 'node[kind = "template"]',
+        style: {{
+          'shape': 'round-rectangle',
+          'background-opacity': 0.3,
+          'border-width': 2,
+          'border-style': 'dashed',
+          'label': 'data(label)',
+          'text-wrap': 'wrap',
+          'text-max-width': 220,
+          'font-size': 12
+        }}
+      }},
+      {{
+        selector: 'node[kind = "template-child"]',
+        style: {{
+          'shape': 'ellipse',
+          'background-opacity': 0.2,
+          'border-width': 1,
+          'border-style': 'dashed',
+          'label': 'data(label)',
+          'text-wrap': 'wrap',
+          'text-max-width': 220,
+          'font-size': 12
+        }}
+      }},
       {{
         selector: 'edge',
         style: {{
@@ -66,18 +201,40 @@ def to_cytoscape_fragment(nodes, edges):
   }});
 
   let selected = null;
+  // Why Delete does nothing on folded nodes; only set where Delete exists.
+  let readOnlyNote = '';
+
+  function pathOf(n) {{
+    const parts = [];
+    const seen = new Set();
+    let cur = n;
+    while (cur && cur.length && !seen.has(cur.id())) {{
+      seen.add(cur.id());
+      const d = cur.data();
+      parts.unshift(d.seg !== undefined ? d.seg : d.label);
+      if (d.prefix) {{ parts.unshift(d.prefix); break; }}
+      // A template hangs below every parent of its occurrences: its path,
+      // and that of its expansion, starts at the template itself.
+      if (d.kind === 'template') break;
+      cur = cur.incomers('node').first();
+    }}
+    return parts.filter(Boolean).join(' > ');
+  }}
 
   function updateInfo(n) {{
     const box = document.getElementById('info');
     if (!n) {{ box.textContent = 'Click a node to see details…'; box.className='muted'; return; }}
     const d = n.data();
+    const path = pathOf(n);
     const esc = (s) => (s||'').toString().replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');
     box.className='';
     box.innerHTML = `
       <div><strong>${{esc(d.label)}}</strong></div>
     <div class=\"muted\">${{ [d.kind, d.type, d.role].filter(Boolean).map(x=>esc(x)).join(' • ') }}</div>
-    ${{ d.path ? `<div><span class=\"muted\">Path:</span> ${{esc(d.path)}}</div>` : '' }}
+    ${{ path ? `<div><span class=\"muted\">Path:</span> ${{esc(path)}}</div>` : '' }}
     ${{ d.route ? `<div><span class=\"muted\">Route:</span> ${{esc(d.route)}}</div>` : '' }}
+    ${{ d.count ? `<div><span class=\"muted\">Repeated:</span> ${{d.count}} times, ${{d.size}} nodes each${{ d.expanded ? '' : ' (click to expand)' }}</div>` : '' }}
+    ${{ readOnlyNote && ['template', 'template-child'].includes(d.kind) ? `<div class=\"muted\" style=\"margin-top:8px\">${{esc(readOnlyNote)}}</div>` : '' }}
       <div class=\"muted\" style=\"margin-top:8px\">ID: ${{esc(d.id)}}</div>
     `;
   }}
@@ -94,7 +251,7 @@ def to_cytoscape_fragment(nodes, edges):
   function applyFilters() {{
     const re = q.value ? new RegExp(q.value, 'i') : null;
     cy.nodes().forEach(n => {{
-      const isAction = n.data('kind') === 'action';
+      const isAction = (n.data('was') || n.data('kind')) === 'action';
       let vis = true;
       if (re && !re.test(n.data('label'))) vis = false;
       if (isAction && !toggleActions.checked) vis = false;
@@ -114,27 +271,7 @@ def to_cytoscape_fragment(nodes, edges):
   // initial fit
   setTimeout(() => cy.fit(null, 30), 100);
 
-  // Delete selected node with Delete key
-  function isFormElement(el) {{
-    return el && (el.tagName === 'INPUT' || el.tagName === 'TEXTAREA' || el.isContentEditable);
-  }}
-  document.addEventListener('keydown', async (e) => {{
-    if (e.key !== 'Delete') return;
-    if (isFormElement(document.activeElement)) return;
-    if (!selected) return;
-    const id = selected.id();
-    try {{
-      await fetch('/delete', {{
-        method: 'POST',
-        headers: {{ 'Content-Type': 'application/json' }},
-  body: JSON.stringify({{ id }})
-      }});
-      // Page will auto-reload via WebSocket broadcast
-    }} catch (err) {{
-      console.error('Delete failed', err);
-    }}
-  }});
-</script>
+{_LIVE_SCRIPT if live else ''}</script>
 """
     return script
 
@@ -143,5 +280,5 @@ def visualize_tree(tree: dict) -> str:
     """Return only the tree fragment (script) to be embedded into a template."""
     nodes = tree.get("nodes", {})
     edges = tree.get("edges", [])
-    out = to_cytoscape_fragment(nodes, edges)
+    out = to_cytoscape_fragment(nodes, edges, tree.get("templates"))
     return out
@@ -1,10 +1,23 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import asyncio
+import cProfile
+import time
+
+from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from starlette.websockets import WebSocketState
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from tree_host.actions import tree
+from tree_host.admission import AdmissionController, Rejected
+from tree_host.profiling import (
+    RequestProfiler,
+    collect_worker_profiles,
+    cprofile_report,
+    sample_workers,
+)
+from tree_host.domain import tree_builder, tree_export
+from tree_host.response import cache
 
 
 app = FastAPI()
@@ -31,6 +44,12 @@ class DeleteItem(BaseModel):
     id: str
 
 
+class MoveItem(BaseModel):
+    id: str
+    parent: str | None = None
+    title: str | None = None
+
+
 class ConnectionManager:
     """Manage active WebSocket connections and broadcast events."""
 
@@ -64,26 +83,209 @@ class ConnectionManager:
 
 
 manager = ConnectionManager()
+admission = AdmissionController.from_env()
+profiler = RequestProfiler.from_env()
+cprofile_lock = asyncio.Lock()
+
+
+class ProfileRequests:
+    """Profile on demand (?profile= or X-Profile:) and sample slow requests.
+
+    `sample` (or any other value) answers with the request's folded stack
+    samples, `cprofile` with a cProfile report, instead of the normal body;
+    the original status is sent in X-Profiled-Status. Both also cover the
+    request's profiled() threadpool work; only one cprofile runs at a time,
+    others get 409. A plain ASGI middleware, so requests that are not
+    profiled pass straight through.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        mode = request.query_params.get("profile") or request.headers.get("x-profile")
+        if request.url.path.startswith("/profiles") or (
+            not mode and not profiler.sampling_all
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if mode != "cprofile":
+            await self._profiled(request, receive, send, mode, None, ())
+            return
+        # cProfile cannot nest: one cprofile request at a time.
+        if cprofile_lock.locked():
+            response = PlainTextResponse(
+                "A cprofile request is already running", status_code=409
+            )
+            await response(scope, receive, send)
+            return
+        async with cprofile_lock:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError as e:  # another profiling tool is active (3.12+)
+                await PlainTextResponse(str(e), status_code=409)(scope, receive, send)
+                return
+            with collect_worker_profiles() as workers:
+                await self._profiled(request, receive, send, mode, prof, workers)
+
+    async def _profiled(self, request: Request, receive, send, mode, prof, workers):
+        profile = profiler.begin(request.method, request.url.path)
+        started = time.perf_counter()
+        status = 500
+
+        async def swallow(message) -> None:
+            # The profile replaces the body, which is still produced in full
+            # so streamed work is part of the profile.
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        try:
+            with sample_workers(profile):
+                await self.app(request.scope, receive, swallow if mode else send)
+        finally:
+            if prof is not None:
+                prof.disable()
+            profiler.end(profile, time.perf_counter() - started, keep=bool(mode))
+        if not mode:
+            return
+
+        headers = {"X-Profile-Id": str(profile.id), "X-Profiled-Status": str(status)}
+        if prof is not None:
+            body = cprofile_report(prof, workers=workers)
+        else:
+            body = profile.folded()
+        await PlainTextResponse(body, headers=headers)(request.scope, receive, send)
 
 
-@app.get("/")
-async def index():
-    html_content = await tree.load_index()
-    return HTMLResponse(content=html_content, media_type="text/html")
+app.add_middleware(ProfileRequests)
+
+
+async def ingest_slot(request: Request):
+    client = admission.client_key(
+        request.client.host if request.client else None, request.headers
+    )
+    try:
+        async with admission.write(client):
+            yield
+    except Rejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        ) from e
 
 
-@app.post("/update-tree")
+async def viewer_slot():
+    async with admission.read():
+        yield
+
+
+@app.get("/", dependencies=[Depends(viewer_slot)])
+async def index(request: Request):
+    page = await tree.load_index()
+    encoding = cache.choose_encoding(request.headers.get("accept-encoding"))
+    headers = {"ETag": page.etag_for(encoding), "Vary": "Accept-Encoding"}
+    if cache.etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding != cache.IDENTITY:
+        headers["Content-Encoding"] = encoding
+    return HTMLResponse(content=await page.encoded_async(encoding), headers=headers)
+
+
+@app.post("/update-tree", dependencies=[Depends(ingest_slot)])
 async def update(data: ActionItem):
     await tree.update_tree(data.model_dump())
     await manager.broadcast("tree_updated")
 
 
-@app.post("/delete")
+@app.post("/delete", dependencies=[Depends(ingest_slot)])
 async def delete_node(data: DeleteItem):
     await tree.delete_node({"id": data.id})
     await manager.broadcast("tree_updated")
 
 
+@app.post("/move", dependencies=[Depends(ingest_slot)])
+async def move_node(data: MoveItem):
+    # An omitted parent keeps the current one; an explicit null makes the
+    # node top-level.
+    payload = data.model_dump(include=data.model_fields_set | {"id"})
+    try:
+        result = await tree.move_node(payload)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"No node with id {e.args[0]!r}") from e
+    except tree_builder.MoveConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if result["moved"]:
+        await manager.broadcast("tree_updated")
+    return result
+
+
+@app.get("/export/{fmt}", dependencies=[Depends(viewer_slot)])
+async def export(fmt: str, root: str | None = None, depth: int | None = None):
+    try:
+        chunks = await tree.export_tree(fmt, root=root, depth=depth)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"No node with id {root!r}") from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    filename = f"tree.{tree_export.EXTENSIONS[fmt]}"
+    return StreamingResponse(
+        chunks,
+        media_type=tree_export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'inline; filename="{filename}"'},
+    )
+
+
+@app.get("/elements", dependencies=[Depends(viewer_slot)])
+async def elements(root: str):
+    try:
+        return await tree.subtree_elements(root)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"No node with id {root!r}") from e
+
+
+@app.get("/stats", dependencies=[Depends(viewer_slot)])
+async def stats():
+    return await tree.tree_stats()
+
+
+@app.get("/stats/orphans", dependencies=[Depends(viewer_slot)])
+async def stats_orphans(limit: int = 100):
+    return await tree.orphan_actions(limit)
+
+
+@app.get("/admission")
+async def admission_stats():
+    return admission.snapshot()
+
+
+@app.get("/profiles")
+async def list_profiles():
+    return [p.summary() for p in reversed(profiler.profiles)]
+
+
+@app.get("/profiles/{profile_id}")
+async def download_profile(profile_id: int):
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not kept (or expired)")
+    return PlainTextResponse(
+        profile.folded(),
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'
+        },
+    )
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
@@ -0,0 +1,224 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+# Profiles taken in worker threads for the cprofile request being served.
+_worker_profiles: ContextVar[list | None] = ContextVar(
+    "tree_host_worker_profiles", default=None
+)
+# The sampled profile of the request being served, if any.
+_sampled_profile: ContextVar["Profile | None"] = ContextVar(
+    "tree_host_sampled_profile", default=None
+)
+# Before 3.12 a cProfile.Profile only sees the thread that enabled it; from
+# 3.12 on it hooks sys.monitoring, which covers every thread, and no second
+# profiler may be enabled while it runs.
+_PER_THREAD_CPROFILE = sys.version_info < (3, 12)
+
+# Frames a thread sits in while it has nothing to do; such samples are noise.
+_IDLE_FILES = ("selectors.py", "threading.py", "queue.py")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _label(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+def fold_stack(frame) -> str | None:
+    """Return a frame's stack root-first in flamegraph "folded" form."""
+    if frame.f_code.co_filename.endswith(_IDLE_FILES):
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+@dataclass
+class Profile:
+    id: int
+    method: str
+    path: str
+    started: float
+    duration: float = 0.0
+    thread_id: int = 0
+    samples: Counter = field(default_factory=Counter)
+    # Worker threads currently running a profiled() call of this request.
+    workers: set[int] = field(default_factory=set)
+
+    def folded(self) -> str:
+        """Render as folded stacks (flamegraph.pl, speedscope, inferno)."""
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(self.samples.items()))
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started": self.started,
+            "duration_ms": round(self.duration * 1000, 3),
+            "samples": sum(self.samples.values()),
+        }
+
+
+class RequestProfiler:
+    """Statistical stack sampler scoped to in-flight requests.
+
+    A background thread samples the stacks of the thread serving each
+    tracked request (the event loop) and of the worker threads running its
+    profiled() calls every `interval` seconds. Requests slower than
+    `slow_threshold` seconds, and requests that asked to be profiled, are
+    kept in a ring buffer of the last `keep` profiles. Concurrent requests
+    on the event loop share its samples, so each one also sees the others'
+    work there, but not in the threadpool.
+    """
+
+    def __init__(
+        self, interval: float = 0.005, slow_threshold: float = 0.0, keep: int = 32
+    ) -> None:
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.profiles: deque[Profile] = deque(maxlen=max(1, keep))
+        self._ids = itertools.count(1)
+        self._active: dict[int, Profile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_env(cls) -> "RequestProfiler":
+        return cls(
+            interval=_env_float("TREE_HOST_PROFILE_INTERVAL_MS", 5) / 1000,
+            slow_threshold=_env_float("TREE_HOST_PROFILE_SLOW_MS", 0) / 1000,
+            keep=int(_env_float("TREE_HOST_PROFILE_KEEP", 32)),
+        )
+
+    @property
+    def sampling_all(self) -> bool:
+        return self.slow_threshold > 0
+
+    def begin(self, method: str, path: str) -> Profile:
+        profile = Profile(
+            next(self._ids), method, path, time.time(), thread_id=threading.get_ident()
+        )
+        with self._lock:
+            self._active[profile.id] = profile
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="tree-host-profiler", daemon=True
+            )
+            self._thread.start()
+        self._wake.set()
+        return profile
+
+    def end(self, profile: Profile, duration: float, keep: bool = False) -> None:
+        with self._lock:
+            self._active.pop(profile.id, None)
+        profile.duration = duration
+        if keep or (self.sampling_all and duration >= self.slow_threshold):
+            self.profiles.append(profile)
+
+    def get(self, profile_id: int) -> Profile | None:
+        return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            threads = {p.id: {p.thread_id, *set(p.workers)} for p in active}
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            stacks = {}
+            for tid in set().union(*threads.values()):
+                frame = frames.get(tid)
+                if tid != me and frame is not None:
+                    stacks[tid] = fold_stack(frame)
+            for p in active:
+                for tid in threads[p.id]:
+                    stack = stacks.get(tid)
+                    if stack:
+                        p.samples[stack] += 1
+            time.sleep(self.interval)
+
+
+@contextmanager
+def sample_workers(profile: Profile):
+    """Have profiled() calls made in this context sampled into `profile`."""
+    token = _sampled_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _sampled_profile.reset(token)
+
+
+@contextmanager
+def collect_worker_profiles():
+    """Collect the profiles of profiled() calls made in this context."""
+    collected: list[cProfile.Profile] = []
+    token = _worker_profiles.set(collected)
+    try:
+        yield collected
+    finally:
+        _worker_profiles.reset(token)
+
+
+def profiled(fn):
+    """Wrap `fn` for the threadpool so a profiled request also covers it.
+
+    Under sample_workers() the worker thread is sampled into the request's
+    profile while `fn` runs; under collect_worker_profiles() it is run
+    under its own cProfile unless cProfile already sees all threads.
+    Otherwise `fn` is returned unchanged.
+    """
+    sampled = _sampled_profile.get()
+    collected = _worker_profiles.get() if _PER_THREAD_CPROFILE else None
+    if sampled is None and collected is None:
+        return fn
+
+    def run(*args, **kwargs):
+        tid = threading.get_ident()
+        if sampled is not None:
+            sampled.workers.add(tid)
+        try:
+            if collected is None:
+                return fn(*args, **kwargs)
+            prof = cProfile.Profile()
+            try:
+                return prof.runcall(fn, *args, **kwargs)
+            finally:
+                collected.append(prof)
+        finally:
+            if sampled is not None:
+                sampled.workers.discard(tid)
+
+    return run
+
+
+def cprofile_report(prof: cProfile.Profile, limit: int = 60, workers=()) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out)
+    for worker in workers:
+        stats.add(worker)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,127 @@
+import asyncio
+import gzip
+import hashlib
+import threading
+from typing import Awaitable, Callable, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import brotli
+except ImportError:  # optional: br is simply not offered without it
+    brotli = None
+
+IDENTITY = "identity"
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def supported_encodings() -> tuple[str, ...]:
+    """Encodings in server preference order."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str | None) -> str:
+    """Pick the best encoding the client accepts from an Accept-Encoding header."""
+    if not accept_encoding:
+        return IDENTITY
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in supported_encodings():
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return IDENTITY
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Evaluate an If-None-Match header against `etag` (weak comparison)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class CachedPage:
+    """One rendered page and its lazily built compressed variants.
+
+    Each encoding is a different representation, so each gets its own
+    strong ETag (etag_for).
+    """
+
+    def __init__(self, key: Hashable, html: str) -> None:
+        self.key = key
+        self.body = html.encode("utf-8")
+        self._digest = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        self.etag = self.etag_for(IDENTITY)
+        self._encoded: dict[str, bytes] = {IDENTITY: self.body}
+        self._lock = threading.Lock()
+
+    def etag_for(self, encoding: str) -> str:
+        if encoding == IDENTITY:
+            return f'"{self._digest}"'
+        return f'"{self._digest}-{encoding}"'
+
+    async def encoded_async(self, encoding: str) -> bytes:
+        """encoded(), compressing in the threadpool the first time."""
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = await run_in_threadpool(self.encoded, encoding)
+        return data
+
+    def encoded(self, encoding: str) -> bytes:
+        data = self._encoded.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(encoding)
+                if data is None:
+                    data = _compress(self.body, encoding)
+                    self._encoded[encoding] = data
+        return data
+
+
+class ResponseCache:
+    """Keep the rendered page for the current data generation.
+
+    Concurrent misses for the same generation wait on one render, so N
+    viewers reloading after a broadcast cost one render and one compression
+    per encoding.
+    """
+
+    def __init__(self) -> None:
+        self._page: CachedPage | None = None
+        self._lock = asyncio.Lock()
+
+    async def get(
+        self, key: Hashable, render: Callable[[], Awaitable[str]]
+    ) -> CachedPage:
+        page = self._page
+        if page is not None and page.key == key:
+            return page
+        async with self._lock:
+            page = self._page
+            if page is None or page.key != key:
+                page = CachedPage(key, await render())
+                self._page = page
+        return page
+
+    def invalidate(self) -> None:
+        self._page = None
@@ -4,9 +4,50 @@ TEMPLATE_PATH = os.path.join(
     os.path.dirname(os.path.dirname(__file__)), "static", "template.html"
 )
 PLACEHOLDER = "<!-- TREE_HTML_PLACEHOLDER -->"
+CYTOSCAPE_PLACEHOLDER = "<!-- CYTOSCAPE_SCRIPT_PLACEHOLDER -->"
+# Template parts that need a server behind the page (the /ws reloader).
+LIVE_START = "<!-- LIVE_START -->"
+LIVE_END = "<!-- LIVE_END -->"
+CYTOSCAPE_URL = "https://unpkg.com/cytoscape@3.26.0/dist/cytoscape.min.js"
 
+_template: tuple[int, str] | None = None
 
-def render_html(tree_html: str) -> str:
-    with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
-        tpl = f.read()
+
+def _load_template() -> str:
+    """Return the template text, re-reading it only when the file changed."""
+    global _template
+    mtime_ns = os.stat(TEMPLATE_PATH).st_mtime_ns
+    if _template is None or _template[0] != mtime_ns:
+        with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+            _template = (mtime_ns, f.read())
+    return _template[1]
+
+
+def _strip_live(tpl: str) -> str:
+    parts = []
+    pos = 0
+    while (start := tpl.find(LIVE_START, pos)) != -1:
+        end = tpl.find(LIVE_END, start)
+        if end == -1:
+            break
+        parts.append(tpl[pos:start])
+        pos = end + len(LIVE_END)
+    parts.append(tpl[pos:])
+    return "".join(parts)
+
+
+def render_html(
+    tree_html: str, cytoscape_src: str = CYTOSCAPE_URL, live: bool = True
+) -> str:
+    """Fill the page template.
+
+    `live` False renders a server-less page (static hosting): the template
+    blocks between LIVE_START and LIVE_END are dropped. `tree_html` should
+    then be built without its live parts as well.
+    """
+    tpl = _load_template()
+    tpl = tpl if live else _strip_live(tpl)
+    tpl = tpl.replace(
+        CYTOSCAPE_PLACEHOLDER, f'<script src="{cytoscape_src}"></script>'
+    )
     return tpl.replace(PLACEHOLDER, tree_html)